@@ -1,14 +1,22 @@
 """Finate automaton implementation."""
-import os
-from collections import defaultdict
-import subprocess
+import io
 import logging
-from IPython.display import Image, display
+from array import array
+from time import perf_counter
+
+import instrumentation
+from matchers import (BitsetNFA, CompiledDFA, FlatNFA, LazyDFA, closure_masks,
+                      csr, empty_table, load_dfa, minimize, read_chunks,
+                      subset_construction)
+from utils import letter_ranges
 
 log = logging.getLogger(__name__)
 
 class State:
     """A state of a finate automaton."""
+    __slots__ = ('name', 'transitions', 'active', '_newly_activated', '_closure',
+                 '_graph', 'ready', '__weakref__')
+
     def __init__(self, name):
         """Constructor.
 
@@ -19,10 +27,12 @@ class State:
 
         """
         self.name = name
-        self.transitions = defaultdict(list)
+        self.transitions = dict()  # letter -> list of states
 
         self.active = False
         self._newly_activated = False
+        self._closure = None  # (graph, revision, epsilon closure)
+        self._graph = None  # see _EpsilonGraph
 
     def clone_transitions(self, other):
         """Copy the transitions from another state.
@@ -40,6 +50,9 @@ class State:
         for key, value in other.transitions.items():
             self.transitions[key] = value
 
+        if other.transitions.get('$'):
+            self._join([other])
+
     def is_active(self):
         return self.active
 
@@ -55,21 +68,60 @@ class State:
             A state or list of states.
 
         """
+        targets = self.transitions.setdefault(letter, [])
         if isinstance(state, list):
-            self.transitions[letter].extend(state)
+            targets.extend(state)
         else:
-            self.transitions[letter].append(state)
+            targets.append(state)
+
+        if letter == '$':
+            self._join(state if isinstance(state, list) else [state])
 
     def epsilon_closure(self):
-        """Return the epsilon closure of the state."""
-        U = set([self])
-        if '$' in self.transitions:
-            U = U.union(set(self.transitions['$']))
-            for s in self.transitions['$']:
-                U = U.union(s.epsilon_closure())
-            return U
+        """Return the epsilon closure of the state.
 
-        return U
+        Note
+        -----
+        The closure is memoized and recomputed only after an epsilon
+        transition has been added (with :meth:`add_transition` or
+        :meth:`clone_transitions`) to a state connected to this one by
+        epsilon transitions (see :class:`_EpsilonGraph`).
+
+        Returns
+        --------
+        :obj:`frozenset(State)`
+
+        """
+        if not self._has_closure():
+            epsilon_closures([self])
+
+        return self._closure[2]
+
+    def _has_closure(self):
+        closure = self._closure
+        if closure is None:
+            return False
+        graph = self._epsilon_graph()
+        return closure[0] is graph and closure[1] == graph.revision
+
+    def _epsilon_graph(self):
+        """Return the graph of epsilon transitions containing the state."""
+        graph = self._graph
+        if graph is None:
+            graph = self._graph = _EpsilonGraph()
+        elif graph.parent is not None:
+            graph = self._graph = graph.find()
+
+        return graph
+
+    def _join(self, states):
+        """Merge the graphs of states reached by new epsilon transitions."""
+        graph = self._epsilon_graph()
+        for state in states:
+            other = state._epsilon_graph()
+            if other is not graph:
+                other.parent = graph
+        graph.revision += 1
 
     def _is_newly_activated(self):
         return self._newly_activated
@@ -80,19 +132,22 @@ class State:
     def _activate(self):
         """Activate the state.
 
-        In addition, recursively activate states reachable by epsilon transitions.
+        In addition, activate the states reachable by epsilon transitions.
         """
-        self.active = self._newly_activated = True
-        log.info('activate: {}'.format(self.name))
-        # if this check is not performed, '$' is added to the defaultdict transitions
-        if '$' in self.transitions:
-            for s in self.transitions['$']:
-                s._activate()
+        closure = self.epsilon_closure()
+        for s in closure:
+            s.active = s._newly_activated = True
+
+        tracer = instrumentation.tracer
+        if tracer is not None:
+            for s in closure:
+                tracer.activate(s)
 
     def _deactivate(self, where=None):
         """Deactivate the state."""
         self.active = self._newly_activated = False
-        log.info('deactivate: {} ({})'.format(self.name, where))
+        if instrumentation.tracer is not None:
+            instrumentation.tracer.deactivate(self, where)
 
     def __repr__(self):
         """Describe object."""
@@ -121,6 +176,82 @@ class State:
 
         return True
 
+class _EpsilonGraph:
+    """States connected by epsilon transitions (union-find).
+
+    Note
+    -----
+    An epsilon transition merges the graphs of its states and increments
+    the revision of the merged graph. The closure of a state only depends
+    on its graph, so a memoized closure is valid as long as the graph and
+    its revision are unchanged, whatever happens to other automata.
+    """
+    __slots__ = ('parent', 'revision')
+
+    def __init__(self):
+        self.parent = None
+        self.revision = 0
+
+    def find(self):
+        """Return the representative of the graph (with path compression)."""
+        root = self
+        while root.parent is not None:
+            root = root.parent
+
+        node = self
+        while node is not root:
+            node.parent, node = root, node.parent
+
+        return root
+
+def epsilon_closures(states):
+    """Compute and memoize the epsilon closures of states in a single pass.
+
+    Note
+    -----
+    The states reachable by epsilon transitions from the states whose
+    memoized closure is outdated are numbered, and all their closures are
+    computed at once by :func:`matchers.closure_masks` (strongly connected
+    components of the graph of epsilon transitions).
+
+    Parameters
+    -----------
+    states : iterable of :obj:`State`
+        States whose closures to compute.
+
+    """
+    ids, order = dict(), []
+    for root in states:
+        if root in ids or root._has_closure():
+            continue
+
+        ids[root] = len(order)
+        order.append(root)
+        stack = [root]
+        while stack:
+            for w in stack.pop().transitions.get('$', []):
+                if w not in ids:
+                    ids[w] = len(order)
+                    order.append(w)
+                    stack.append(w)
+
+    epsilon = [[ids[w] for w in v.transitions.get('$', [])] for v in order]
+    closures = dict()  # mask -> frozenset(State)
+    for v, mask in zip(order, closure_masks(epsilon)):
+        closure = closures.get(mask)
+        if closure is None:
+            members, rest = [], mask
+            while rest:
+                low = rest & -rest
+                members.append(order[low.bit_length() - 1])
+                rest ^= low
+            closure = closures[mask] = frozenset(members)
+        graph = v._epsilon_graph()
+        v._closure = (graph, graph.revision, closure)
+
+    if order and instrumentation.tracer is not None:
+        instrumentation.tracer.closures(len(order))
+
 class Automaton:
     """A finate automaton.
 
@@ -172,10 +303,11 @@ class Automaton:
         self._reset_new_activations()
 
     def epsilon_closure(self, states):
-        """Compute the epsilon closure of the fiven states."""
+        """Compute the epsilon closure of the given states."""
+        epsilon_closures(states)
         E = set()
         for s in states:
-            E = E.union(s.epsilon_closure())
+            E.update(s._closure[2])
 
         return E
 
@@ -201,52 +333,58 @@ class Automaton:
 
         Note
         -----
-        Clear example: Dragon book, Section 3.7.1.
+        Clear example: Dragon book, Section 3.7.1. The subset construction
+        itself is performed on bitmasks by :func:`matchers.subset_construction`.
 
         """
         if self.is_dfa():
             log.warning('The automaton is already deterministic.')
             return
 
-        dfa_states = dict()
-
-        E = self.q0.epsilon_closure()
-        new_state = State('0'); new_state.ready = False
-        dfa_states[frozenset(E)] = new_state
+        nfa = self.bitset_nfa()
+        masks, table, accepting = subset_construction(nfa)
 
-        to_process = [(key, state) for key, state in dfa_states.items()
-                      if not state.ready]
-        counter = 1
-        while any(to_process):
-            nfa_states, current_dfa_state = to_process[0]
+        D = [State(str(idx)) for idx in range(len(masks))]
+        n_letters = len(self.Sigma)
+        for idx, state in enumerate(D):
+            row = table[idx * n_letters:(idx + 1) * n_letters]
+            for letter, target in zip(self.Sigma, row):
+                state.add_transition(letter, D[target])
 
-            for letter in self.Sigma:
-                E = self.epsilon_closure(self.reachable_states(nfa_states, letter))
-                key = frozenset(E)
-                if key not in dfa_states:
-                    new_state = State(str(counter)); new_state.ready = False
-                    dfa_states[key] = new_state
-                    current_dfa_state.add_transition(letter, new_state)
-                    counter += 1
-                else:
-                    current_dfa_state.add_transition(letter, dfa_states[key])
-
-            current_dfa_state.ready = True
-            to_process = [(key, state) for key, state in dfa_states.items()
-                          if not state.ready]
-
-        F = []
-        for idx, (key, state) in enumerate(dfa_states.items()):
-            state.ready = [k.name for k in key]  # store the corresponding dfa states
+            state.ready = nfa.names(masks[idx])  # store the corresponding nfa states
             if summary:
                 print('{}: {}'.format(idx, state.ready))
 
-            if any([f in key for f in self.F]):
-                F.append(state)
-
-        D = list(dfa_states.values())
+        F = [state for state, accept in zip(D, accepting) if accept]
         return Automaton('D', D, self.Sigma.copy(), D[0], F)
 
+    def minimize(self):
+        """Return the minimal deterministic automaton (Hopcroft's algorithm).
+
+        Note
+        -----
+        Unreachable and dead states are pruned, so the result may have
+        undefined transitions. The name of each state joins the names of the
+        equivalent states it replaces (their list is stored in `ready`).
+
+        """
+        C, blocks = minimize(self.compile())
+
+        Q = []
+        for members in blocks:
+            state = State(','.join(str(self.Q[i].name) for i in members))
+            state.ready = [self.Q[i].name for i in members]
+            Q.append(state)
+
+        for i, state in enumerate(Q):
+            row = C.table[i * C.n_letters:(i + 1) * C.n_letters]
+            for letter, target in zip(self.Sigma, row):
+                if target >= 0:
+                    state.add_transition(letter, Q[target])
+
+        F = [state for state, accept in zip(Q, C.accepting) if accept]
+        return Automaton(self.name, Q, self.Sigma.copy(), Q[0], F)
+
     def is_dfa(self):
         """Verify whether the automaton is deterministic."""
         for s in self.Q:
@@ -259,6 +397,209 @@ class Automaton:
 
         return True
 
+    def compile(self):
+        """Return an immutable matcher with a dense integer transition table.
+
+        Note
+        -----
+        States are numbered in the order of :obj:`Q` and letters in the order
+        of :obj:`Sigma`. Missing transitions are allowed (they reject).
+
+        Returns
+        --------
+        :obj:`matchers.CompiledDFA`
+
+        """
+        index = {s: i for i, s in enumerate(self.Q)}
+        n_letters = len(self.Sigma)
+        table = empty_table(len(self.Q), n_letters)
+        for i, s in enumerate(self.Q):
+            if s.transitions.get('$'):
+                raise ValueError('Cannot compile epsilon transitions '
+                                 '(state {}), use to_dfa first.'.format(s.name))
+
+            for j, letter in enumerate(self.Sigma):
+                targets = s.transitions.get(letter)
+                if not targets:
+                    continue
+                if len(set(targets)) > 1:
+                    raise ValueError('State {} is nondeterministic upon {}, '
+                                     'use to_dfa first.'.format(s.name, letter))
+                if targets[0] not in index:
+                    raise ValueError('State {} is not in Q.'.format(targets[0].name))
+                table[i * n_letters + j] = index[targets[0]]
+
+        F = set(self.F)
+        accepting = bytes(s in F for s in self.Q)
+        return CompiledDFA(self.Sigma, table, index[self.q0], accepting,
+                           [s.name for s in self.Q])
+
+    def save(self, path):
+        """Save a deterministic automaton (see :meth:`matchers.CompiledDFA.save`)."""
+        self.compile().save(path)
+
+    @staticmethod
+    def load(path, name='A'):
+        """Return the automaton saved in a file (see :meth:`save`).
+
+        Note
+        -----
+        To match without building :class:`State` objects (and to share the
+        memory-mapped transition table between processes) use
+        :func:`matchers.load_dfa` instead.
+        """
+        C = load_dfa(path)
+        names = C.state_names or [str(i) for i in range(C.n_states)]
+        Q = [State(state_name) for state_name in names]
+        for i, state in enumerate(Q):
+            row = C.table[i * C.n_letters:(i + 1) * C.n_letters]
+            for letter, target in zip(C.alphabet, row):
+                if target >= 0:
+                    state.add_transition(letter, Q[target])
+
+        F = [state for state, accept in zip(Q, C.accepting) if accept]
+        return Automaton(name, Q, list(C.alphabet), Q[C.start], F)
+
+    def match_many(self, strings, return_states=False):
+        """Match a batch of strings with a deterministic automaton.
+
+        Note
+        -----
+        See :meth:`matchers.CompiledDFA.match_many`. For repeated batches
+        compile the automaton once with :meth:`compile`.
+        """
+        return self.compile().match_many(strings, return_states)
+
+    def scan(self, source, chunk_size=1 << 20):
+        """Match the automaton against a (possibly huge) input source.
+
+        Parameters
+        -----------
+        source : :obj:`str`, path, binary file object or iterable of chunks
+            See :func:`matchers.read_chunks` (files given by path are mapped
+            in memory, and each byte is a letter).
+
+        chunk_size : :obj:`int`
+            Size (in bytes) of the chunks read from a file.
+
+        Returns
+        --------
+        A generator of the offsets at which the input read so far is accepted.
+
+        """
+        try:
+            matcher = self.compile()
+        except ValueError:
+            matcher = self.bitset_nfa()
+
+        return matcher.scan(read_chunks(source, chunk_size))
+
+    def parallel_run(self, source, n_chunks=None, workers=1):
+        """Return `True` if a (huge) input is accepted, processing chunks in parallel.
+
+        Note
+        -----
+        See :meth:`matchers.CompiledDFA.parallel_fullmatch` (the automaton
+        is determinized first if necessary). Intended for small DFAs.
+        """
+        try:
+            matcher = self.compile()
+        except ValueError:
+            matcher = self.to_dfa().compile()
+
+        return matcher.parallel_fullmatch(source, n_chunks, workers)
+
+    def bitset_nfa(self):
+        """Return an immutable bitset simulator of the automaton.
+
+        Note
+        -----
+        States are numbered in the order of :obj:`Q`. The simulator does not
+        modify the states, so it can be used while the automaton is running.
+
+        Returns
+        --------
+        :obj:`matchers.BitsetNFA`
+
+        """
+        index = {s: i for i, s in enumerate(self.Q)}
+
+        def ids(states):
+            for s in states:
+                if s not in index:
+                    raise ValueError('State {} is not in Q.'.format(s.name))
+                yield index[s]
+
+        def mask(states):
+            m = 0
+            for i in ids(states):
+                m |= 1 << i
+            return m
+
+        closures = closure_masks([list(ids(s.transitions.get('$', [])))
+                                  for s in self.Q])
+        successors = []
+        for letter in self.Sigma:
+            row = []
+            for s in self.Q:
+                m = 0
+                for i in ids(s.transitions.get(letter, [])):
+                    m |= closures[i]
+                row.append(m)
+            successors.append(row)
+
+        return BitsetNFA(self.Sigma, closures[index[self.q0]], mask(self.F),
+                         successors, [s.name for s in self.Q])
+
+    def run(self, input):
+        """Return `True` if input is accepted (the states are not modified).
+
+        Note
+        -----
+        For repeated runs build the simulator once with :meth:`bitset_nfa`.
+        """
+        return self.bitset_nfa().run(input)
+
+    def freeze(self):
+        """Return an immutable matcher that can be shared between threads.
+
+        Note
+        -----
+        A deterministic automaton is compiled to a :obj:`matchers.CompiledDFA`,
+        otherwise a :obj:`matchers.BitsetNFA` is returned. Each concurrent
+        session uses its own cursor (e.g., `frozen.cursor()`), which holds
+        only a state id or a mask of active states.
+        """
+        try:
+            return self.compile()
+        except ValueError:
+            return self.bitset_nfa()
+
+    def cursor(self):
+        """Return a resumable cursor over a bitset simulator of the automaton.
+
+        Note
+        -----
+        The simulator is built at each call: for many cursors use
+        :meth:`freeze` once instead.
+        """
+        return self.bitset_nfa().cursor()
+
+    def lazy_dfa(self, max_states=1024):
+        """Return a DFA that is built on demand while matching.
+
+        Note
+        -----
+        Unlike :meth:`to_dfa` only the DFA states reached by the input are
+        created, and at most `max_states` of them are kept in memory.
+
+        Returns
+        --------
+        :obj:`matchers.LazyDFA`
+
+        """
+        return LazyDFA(self.bitset_nfa(), max_states)
+
     @property
     def active_states(self):
         """Return active stetas."""
@@ -270,17 +611,26 @@ class Automaton:
         letter : :obj:`str`
             A letter from :obj:`Sigma`.
 
+        Note
+        -----
+        The installed tracer (see :mod:`instrumentation`) is notified of the
+        letter and the duration of the transition.
         """
-        log.info('transition with letter {}'.format(letter))
+        tracer = instrumentation.tracer
+        if tracer is None:
+            self._transition(letter)
+        else:
+            start = perf_counter()
+            self._transition(letter)
+            tracer.transition(letter, perf_counter() - start)
+
+    def _transition(self, letter):
         self._deactivate_states(letter)
         for state in self.active_states:
-            target_states = state.transitions[letter]
+            target_states = state.transitions.get(letter, [])
             if target_states and not state._is_newly_activated():
                 state._deactivate('transition')
 
-            log.info('[{}] {} target states: {}'.format(letter,
-                                                        state.name,
-                                                        [t.name for t in target_states]))
             for s in target_states:
                 # prevent re-activating a state if it has been newly activated
                 if not s._is_newly_activated():
@@ -293,63 +643,120 @@ class Automaton:
         A = self.active_states
         return any([True if s in A else False for s in self.F])
 
-    def show_dot(self, filename=None, rankdir='LR'):
-        """Display the dot diagram."""
-        if filename is None:
-            filename = '_fa.png'
-        tmp_name, extension = os.path.splitext(os.path.basename(filename))
-        extension = extension[1:]
-
-        with open(tmp_name + '.dot', 'w') as h:
-            h.write(self.to_dot(rankdir))
-
-        subprocess.call(['dot',
-                         '-T{}'.format(extension),
-                         tmp_name + '.dot',
-                         '-o',
-                         filename])
-        subprocess.call(['rm', tmp_name + '.dot'])
-        display(Image(filename))
-
-    def to_dot(self, rankdir='LR', dpi=300):
-        """Visualize with graphviz dot."""
-        dot_str = 'digraph FA {\n'
-        dot_str += 'graph [dpi={}]\n'.format(dpi)
-        dot_str += 'edge [arrowhead="empty"]\n'
-        dot_str += 'rankdir={}\n'.format(rankdir)
+    def show_dot(self, filename=None, rankdir='LR', **options):
+        """Display the dot diagram (see :func:`visualization.show` and :meth:`write_dot`)."""
+        import visualization
+
+        visualization.show(self, '_fa.png' if filename is None else filename,
+                           rankdir=rankdir, **options)
+
+    def to_dot(self, rankdir='LR', dpi=300, **options):
+        """Visualize with graphviz dot (see :meth:`write_dot`)."""
+        out = io.StringIO()
+        self.write_dot(out, rankdir, dpi, **options)
+
+        return out.getvalue()
+
+    def write_dot(self, stream, rankdir='LR', dpi=300, max_nodes=None,
+                  ranges=False, around=None, depth=None):
+        """Write the dot diagram to a text stream (line by line).
+
+        Parameters
+        -----------
+        stream : text file object
+            Where to write the diagram (e.g., a file or the input of `dot`).
+
+        rankdir : :obj:`str`
+            Direction of the graph layout.
+
+        dpi : :obj:`int`
+            Resolution of the rendered diagram.
+
+        max_nodes : :obj:`int`
+            Draw at most `max_nodes` states (the others are counted in a note).
+
+        ranges : :obj:`bool`
+            Collapse consecutive letters of an edge into ranges, e.g. 'a-z'
+            (see :func:`utils.letter_ranges`).
+
+        around : 'active' or iterable of :obj:`State`
+            Draw only the states reachable from these states (the initial
+            state if only `depth` is given).
+
+        depth : :obj:`int`
+            Draw only the states reachable with at most `depth` transitions
+            (epsilon transitions included).
+
+        """
+        F = set(self.F)
+        states = self._dot_states(around, depth, max_nodes)
+        shown = set(states)
+
+        write = stream.write
+        write('digraph FA {\n')
+        write('graph [dpi={}]\n'.format(dpi))
+        write('edge [arrowhead="empty"]\n')
+        write('rankdir={}\n'.format(rankdir))
 
         # nodes
-        dot_str += '"" [shape=none]\n'
-        for state in self.Q:
-            s = '"{0}"[label="{0}", shape={1} {2}]\n'
-            color = ', fillcolor=lightgray, style=filled'
-            dot_str += s.format(state.name,
-                                'doublecircle' if state in self.F else 'circle',
-                                color if state.is_active() else '')
-
-        # edges
-        dot_str += '"" -> {}\n'.format(self.q0.name)
-        edges = self._identify_multiple_edges()
-        for (state1, state2), letters in edges.items():
-            if '$' in letters:
-                letters = ['&#949;' if l=='$' else l for l in letters]
-            dot_str += '"{}" -> "{}"[label="{}"]\n'.format(state1.name,
-                                                           state2.name,
-                                                           ', '.join(letters))
-
-        dot_str += '}\n'
-
-        return dot_str
-
-    def _identify_multiple_edges(self):
-        """Identify multiple edges between two nodes (for plotting purposes)."""
-        edges = defaultdict(list)
-        for state in self.Q:
+        write('"" [shape=none]\n')
+        color = ', fillcolor=lightgray, style=filled'
+        for state in states:
+            write('"{0}"[label="{0}", shape={1} {2}]\n'.format(
+                state.name,
+                'doublecircle' if state in F else 'circle',
+                color if state.is_active() else ''))
+
+        hidden = len(self.Q) - len(states)
+        if hidden:
+            write('"..."[label="{} more states", shape=note]\n'.format(hidden))
+
+        # edges (multiple edges between two states are grouped in one edge)
+        if self.q0 in shown:
+            write('"" -> "{}"\n'.format(self.q0.name))
+        for state in states:
+            targets = dict()
             for letter, next_states in state.transitions.items():
                 for s in next_states:
-                    edges[(state, s)].append(letter)
-
-        return edges
+                    if s in shown:
+                        targets.setdefault(s, []).append(letter)
+
+            for s, letters in targets.items():
+                if ranges:
+                    letters = letter_ranges(letters)
+                if '$' in letters:
+                    letters = ['&#949;' if l=='$' else l for l in letters]
+                write('"{}" -> "{}"[label="{}"]\n'.format(state.name, s.name,
+                                                           ', '.join(letters)))
+
+        write('}\n')
+
+    def _dot_states(self, around=None, depth=None, max_nodes=None):
+        """Return the states to draw (see :meth:`write_dot`)."""
+        if around is None and depth is None:
+            return self.Q if max_nodes is None else self.Q[:max_nodes]
+
+        if around is None:
+            around = [self.q0]
+        elif around == 'active':
+            around = self.active_states
+
+        # breadth-first search (the states are listed in order of distance)
+        states = list(dict.fromkeys(around))[:max_nodes]
+        seen, level, distance = set(states), 0, 0
+        while level < len(states) and (depth is None or distance < depth):
+            end, distance = len(states), distance + 1
+            for state in states[level:end]:
+                for next_states in state.transitions.values():
+                    for s in next_states:
+                        if s not in seen:
+                            if max_nodes is not None and len(states) >= max_nodes:
+                                return states
+                            seen.add(s)
+                            states.append(s)
+            level = end
+
+        return states
 
     def _reset_new_activations(self):
         """Reset new state activations (after a transition has been completed)."""
@@ -382,18 +789,30 @@ class StateRegister:
     Its purpose is to create states with unique names and manipulate them.
     """
     def __init__(self):
-        self.registered_states = []
+        self.states = dict()  # insertion-ordered set: O(1) registration and removal
         self.current_id = 0 # doesn't decrease when states are dropped from the register.
 
+    @property
+    def registered_states(self):
+        """Return a new list of the registered states (in order of registration)."""
+        return list(self.states)
+
     def new_state(self):
         """Register new state and return it."""
-        self.registered_states.append(State('s' + str(self.current_id)))
+        state = State('s' + str(self.current_id))
+        self.states[state] = None
         self.current_id += 1
-        return self.registered_states[-1]
+        return state
 
     def unregister_state(self, state):
-        """Remove state from register."""
-        self.registered_states.remove(state)
+        """Remove state from register.
+
+        Raises `ValueError` if the state is not registered.
+        """
+        try:
+            del self.states[state]
+        except KeyError:
+            raise ValueError('Unknown state: {}'.format(state.name)) from None
 
 class ThompsonConstruction:
     """Regex to NFA."""
@@ -416,6 +835,11 @@ class ThompsonConstruction:
         return {'initial_state': initial_state,
                 'out_state': out_state}
 
+    def create_empty(self):
+        """NFA for the empty language (no transition)."""
+        return {'initial_state': self.state_register.new_state(),
+                'out_state': self.state_register.new_state()}
+
     def expr_union(self, expr1, expr2):
         """NFA for the union of two expressions."""
         initial_state = self.state_register.new_state()
@@ -451,3 +875,89 @@ class ThompsonConstruction:
 
         return {'initial_state': expr1['initial_state'],
                 'out_state': expr2['out_state']}
+
+class ThompsonArena:
+    """Regex to NFA, with states and transitions appended to flat arrays.
+
+    Note
+    -----
+    Same interface as :class:`ThompsonConstruction`, but states are integers
+    and building is append-only (a concatenation adds an epsilon transition
+    instead of merging states). :meth:`build` returns an immutable
+    :obj:`matchers.FlatNFA`.
+    """
+    def __init__(self):
+        self.n_states = 0
+        self.letter_ids = dict()
+        self.sources, self.letters, self.targets = array('i'), array('i'), array('i')
+        self.eps_sources, self.eps_targets = array('i'), array('i')
+
+    def new_state(self):
+        """Return a new state."""
+        self.n_states += 1
+        return self.n_states - 1
+
+    def add_transition(self, source, letter, target):
+        """Add a transition ('$' denotes an epsilon transition)."""
+        if letter == '$':
+            self.eps_sources.append(source)
+            self.eps_targets.append(target)
+        else:
+            self.sources.append(source)
+            self.letters.append(self.letter_ids.setdefault(letter, len(self.letter_ids)))
+            self.targets.append(target)
+
+    def create_expr(self, letter):
+        """NFA for a new expression."""
+        initial_state, out_state = self.new_state(), self.new_state()
+        self.add_transition(initial_state, letter, out_state)
+
+        return {'initial_state': initial_state,
+                'out_state': out_state}
+
+    def create_empty(self):
+        """NFA for the empty language (no transition)."""
+        return {'initial_state': self.new_state(),
+                'out_state': self.new_state()}
+
+    def expr_union(self, expr1, expr2):
+        """NFA for the union of two expressions."""
+        return self.expr_union_many([expr1, expr2])
+
+    def expr_union_many(self, exprs):
+        """NFA for the union of several expressions (e.g., a dictionary)."""
+        initial_state, out_state = self.new_state(), self.new_state()
+        for expr in exprs:
+            self.add_transition(initial_state, '$', expr['initial_state'])
+            self.add_transition(expr['out_state'], '$', out_state)
+
+        return {'initial_state': initial_state,
+                'out_state': out_state}
+
+    def expr_star(self, expr1):
+        """NFA for the star of an expression."""
+        initial_state, out_state = self.new_state(), self.new_state()
+        for source in [initial_state, expr1['out_state']]:
+            self.add_transition(source, '$', expr1['initial_state'])
+            self.add_transition(source, '$', out_state)
+
+        return {'initial_state': initial_state,
+                'out_state': out_state}
+
+    def expr_concat(self, expr1, expr2):
+        """NFA for the concatenation of two expressions."""
+        self.add_transition(expr1['out_state'], '$', expr2['initial_state'])
+
+        return {'initial_state': expr1['initial_state'],
+                'out_state': expr2['out_state']}
+
+    def build(self, expr):
+        """Return the (immutable) NFA of an expression built in the arena."""
+        offsets, letters, targets = csr(self.n_states, self.sources,
+                                        self.letters, self.targets)
+        eps_offsets, eps_targets = csr(self.n_states, self.eps_sources,
+                                       self.eps_targets)
+
+        return FlatNFA(list(self.letter_ids), expr['initial_state'],
+                       [expr['out_state']], offsets, letters, targets,
+                       eps_offsets, eps_targets)
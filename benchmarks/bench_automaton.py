@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""Construction and matching cost of the automata across pattern families.
+
+For each family and size the pattern is compiled with Thompson's
+construction, determinized and minimized. The build times, state counts and
+peak memory (tracemalloc, measured by a separate build) are reported, as
+well as the matching throughput (letters/s) of each engine for increasing
+input lengths. Matching searches the pattern, i.e., the engines run
+(a+b)*(pattern) on random inputs, so that inputs are not rejected after a
+few letters:
+
+- `transition`: :meth:`automaton.Automaton.transition` on the Thompson NFA
+- `bitset-nfa`: :class:`matchers.BitsetNFA`
+- `lazy-dfa`: :class:`matchers.LazyDFA`
+- `dfa`: :class:`matchers.CompiledDFA` (minimized)
+
+Results are written as JSON and can be compared with the results of
+another commit (timings only, a ratio > 1 is a slowdown).
+
+Example
+--------
+./benchmarks/bench_automaton.py --output new.json --compare old.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import regexp
+
+def blowup(n):
+    """(a+b)*a(a+b)^n: the minimal DFA has 2^(n+1) states."""
+    return '(a+b)*a' + '(a+b)' * n
+
+def concatenation(n):
+    """A concatenation of n letters."""
+    return 'ab' * (n // 2) + 'a' * (n % 2)
+
+def union(n):
+    """A union of n distinct words."""
+    width = max(1, (n - 1).bit_length())
+    return '+'.join(format(i, 'b').zfill(width).replace('0', 'a').replace('1', 'b')
+                    for i in range(n))
+
+def nested_stars(n):
+    """n nested stars, e.g., ((a*b)*a)* for n = 3."""
+    pattern = 'a'
+    for i in range(n):
+        pattern = '({}*{})'.format(pattern, 'ab'[i % 2])
+
+    return pattern + '*'
+
+FAMILIES = {'blowup': (blowup, [4, 8, 12]),
+            'concatenation': (concatenation, [100, 1000, 4000]),
+            'union': (union, [16, 256, 1024]),
+            'nested-stars': (nested_stars, [4, 16, 64])}
+QUICK_SIZES = {'blowup': [4, 8], 'concatenation': [100, 1000],
+               'union': [16, 256], 'nested-stars': [4, 16]}
+LENGTHS = [1000, 10000, 100000]
+# the simulations are slow on large NFAs, so they are measured on short inputs only
+MAX_LENGTH = {'transition': 1000, 'bitset-nfa': 10000}
+
+def timed(f, *args):
+    """Return the result of f(*args) and its duration."""
+    start = time.perf_counter()
+    out = f(*args)
+    return out, time.perf_counter() - start
+
+def run_transitions(nfa, text):
+    nfa.reset()
+    for letter in text:
+        nfa.transition(letter)
+
+    return nfa.is_accepted()
+
+def build_all(pattern):
+    """Build all automata of a pattern, return them and the duration of each step."""
+    nfa, t_nfa = timed(regexp.to_nfa, pattern)
+    bitset_nfa, t_bitset = timed(nfa.bitset_nfa)
+    dfa, t_dfa = timed(nfa.to_dfa)
+    minimal, t_min = timed(dfa.minimize)
+    compiled, t_compile = timed(minimal.compile)
+
+    return (nfa, dfa, minimal), (t_nfa, t_bitset, t_dfa, t_min, t_compile)
+
+def build(pattern):
+    """Build all automata of a pattern and return the cost of each step.
+
+    Note
+    -----
+    tracemalloc slows down allocations a lot, so the builds are timed first
+    without tracing and the peak memory is measured by a second build.
+    """
+    (nfa, dfa, minimal), (t_nfa, t_bitset, t_dfa, t_min, t_compile) = build_all(pattern)
+
+    tracemalloc.start()
+    build_all(pattern)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'nfa_states': len(nfa.Q), 'dfa_states': len(dfa.Q),
+            'min_dfa_states': len(minimal.Q),
+            'nfa_build_s': t_nfa, 'bitset_build_s': t_bitset,
+            'dfa_build_s': t_dfa, 'minimize_s': t_min, 'compile_s': t_compile,
+            'peak_memory_mb': peak / 2**20}
+
+def engines(pattern):
+    """Return the matching engines searching a pattern."""
+    nfa = regexp.to_nfa('(a+b)*({})'.format(pattern))
+    return {'transition': lambda text: run_transitions(nfa, text),
+            'bitset-nfa': nfa.bitset_nfa().run,
+            'lazy-dfa': nfa.lazy_dfa().run,
+            'dfa': nfa.to_dfa().minimize().compile().fullmatch}
+
+def throughput(engines, sigma, lengths, repeat):
+    """Return the best throughput (letters/s) of each engine per input length."""
+    rng = random.Random(0)
+    out = dict()
+    for length in lengths:
+        text = ''.join(rng.choice(sigma) for _ in range(length))
+        for name, run in engines.items():
+            if length > MAX_LENGTH.get(name, length):
+                continue
+            best = min(timed(run, text)[1] for _ in range(repeat))
+            out['{}@{}'.format(name, length)] = length / best
+
+    return out
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+def compare(results, baseline):
+    """Print the ratios new/old of the timings (and old/new of throughputs)."""
+    old = {(r['family'], r['size']): r for r in baseline['results']}
+    print('\ncompared with {}:'.format(baseline.get('commit')))
+    for r in results['results']:
+        b = old.get((r['family'], r['size']))
+        if b is None:
+            continue
+        ratios = ['{} x{:.2f}'.format(key, r[key] / b[key])
+                  for key in r if key.endswith('_s') and b.get(key)]
+        ratios += ['{} x{:.2f}'.format(key, b['throughput'][key] / value)
+                   for key, value in r['throughput'].items()
+                   if b['throughput'].get(key)]
+        print('{}({}): {}'.format(r['family'], r['size'], ', '.join(ratios)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--families', nargs='+', choices=sorted(FAMILIES),
+                        default=sorted(FAMILIES), help='pattern families')
+    parser.add_argument('--quick', action='store_true',
+                        help='small sizes and inputs only')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of timed runs of each match (default: %(default)s)')
+    parser.add_argument('--output', help='write the results to a JSON file')
+    parser.add_argument('--compare', help='JSON results to compare with')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    lengths = LENGTHS[:2] if args.quick else LENGTHS
+    results = {'commit': git_commit(), 'python': platform.python_version(),
+               'results': []}
+    for family in args.families:
+        f, sizes = FAMILIES[family]
+        for size in (QUICK_SIZES[family] if args.quick else sizes):
+            pattern = f(size)
+            stats = build(pattern)
+            stats['throughput'] = throughput(engines(pattern), 'ab', lengths,
+                                             args.repeat)
+            results['results'].append(dict(family=family, size=size, **stats))
+
+            print('{}({}): NFA {} / DFA {} / min {} states, build {:.3f} + {:.3f} + '
+                  '{:.3f} s, peak {:.1f} MB'.format(
+                      family, size, stats['nfa_states'], stats['dfa_states'],
+                      stats['min_dfa_states'], stats['nfa_build_s'],
+                      stats['dfa_build_s'], stats['minimize_s'],
+                      stats['peak_memory_mb']))
+            print('    ' + ', '.join('{} {:.3g}/s'.format(key, value)
+                                     for key, value in stats['throughput'].items()))
+
+    if args.output:
+        with open(args.output, 'w') as h:
+            json.dump(results, h, indent=2)
+
+    if args.compare:
+        with open(args.compare) as h:
+            compare(results, json.load(h))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Throughput of the COOL lexer on the bundled sources.
+
+The sources (cool_examples/*.cl and libs/atoi.cl) are concatenated and
+replicated up to the requested size, then lexed with the (once compiled)
+COOL lexer.
+
+Example
+--------
+./benchmarks/bench_cool_lexer.py --megabytes 4 --repeat 3
+"""
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import cool_lexer
+
+def sources():
+    """Return the paths of the bundled COOL sources."""
+    return (sorted(glob.glob(os.path.join(ROOT, 'cool_examples', '*.cl'))) +
+            [os.path.join(ROOT, 'libs', 'atoi.cl')])
+
+def corpus(megabytes):
+    """Return the bundled sources replicated up to (at least) megabytes."""
+    text = ''
+    for filename in sources():
+        with open(filename) as h:
+            text += h.read() + '\n'
+
+    return text * max(1, int(megabytes * 2**20 / len(text) + 0.5))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--megabytes', type=float, default=1.0,
+                        help='size of the lexed input (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of timed runs (default: %(default)s)')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    start = time.perf_counter()
+    cool_lexer.cool_lexer()
+    build = time.perf_counter() - start
+    print('build: {:.3f} s ({})'.format(build, cool_lexer.cool_lexer()))
+
+    text = corpus(args.megabytes)
+    size = len(text.encode()) / 2**20
+    best, n_tokens = float('inf'), 0
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        n_tokens = sum(1 for _ in cool_lexer.tokenize(text))
+        best = min(best, time.perf_counter() - start)
+
+    print('input: {:.2f} MB, {} tokens'.format(size, n_tokens))
+    print('best of {}: {:.3f} s, {:.0f} tokens/s, {:.2f} MB/s'.format(
+        args.repeat, best, n_tokens / best, size / best))
+
+if __name__ == '__main__':
+    main()
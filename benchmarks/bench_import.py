@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Import time of the automata/regex core (guards the startup budget).
+
+Each measurement imports the core modules in a fresh interpreter. The
+script fails if the best time exceeds the budget or if a heavy optional
+dependency (IPython, numpy, matplotlib) is imported.
+
+Example
+--------
+./benchmarks/bench_import.py --repeat 10 --budget-ms 150
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ['automaton', 'matchers', 'regexp', 'expression_tree', 'utils',
+           'lexer', 'cool_lexer', 'corpus', 'instrumentation']
+HEAVY = ['IPython', 'numpy', 'matplotlib']
+
+SCRIPT = '''
+import sys, time
+start = time.perf_counter()
+import {modules}
+print(time.perf_counter() - start)
+print(' '.join(m for m in {heavy!r} if m in sys.modules))
+'''
+
+def measure(modules=MODULES):
+    """Return the import time (in s) of modules and the heavy modules imported."""
+    script = SCRIPT.format(modules=', '.join(modules), heavy=HEAVY)
+    out = subprocess.run([sys.executable, '-c', script], cwd=ROOT, check=True,
+                         capture_output=True, text=True).stdout.split('\n')
+
+    return float(out[0]), out[1].split()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of fresh interpreters (default: %(default)s)')
+    parser.add_argument('--budget-ms', type=float, default=150,
+                        help='maximum import time (default: %(default)s ms)')
+    args = parser.parse_args()
+
+    times, heavy = zip(*(measure() for _ in range(args.repeat)))
+    best = 1000 * min(times)
+    print('import {}: best {:.1f} ms, median {:.1f} ms (budget {:.0f} ms)'.format(
+        ', '.join(MODULES), best, 1000 * sorted(times)[len(times) // 2],
+        args.budget_ms))
+
+    if heavy[0]:
+        sys.exit('heavy modules imported: {}'.format(', '.join(heavy[0])))
+    if best > args.budget_ms:
+        sys.exit('import budget exceeded')
+
+if __name__ == '__main__':
+    main()
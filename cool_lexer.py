@@ -0,0 +1,114 @@
+"""Lexer for the Classroom Object-Oriented Language (COOL).
+
+Note
+-----
+The token set follows the COOL manual (Section 10): keywords are case
+insensitive except for the first letter of `true` and `false`, strings are
+delimited by '"' and may contain escaped characters (including an escaped
+new line), comments are either `--` up to the end of the line or enclosed
+in `(*` and `*)` and can be nested. Nested comments are not regular, so the
+DFA matches only `(*` and the rest of the comment is consumed by a handler
+(so are line comments, which may contain any character). The character '$'
+denotes epsilon transitions in :mod:`automaton`, so the rules use the null
+character in its place (see the argument `aliases` of :class:`lexer.Lexer`);
+null characters are not allowed in COOL strings.
+"""
+from functools import lru_cache, reduce
+
+from expression_tree import Char
+from lexer import Lexer
+
+KEYWORDS = ['class', 'else', 'fi', 'if', 'in', 'inherits', 'isvoid', 'let',
+            'loop', 'pool', 'then', 'while', 'case', 'esac', 'new', 'of', 'not']
+OPERATORS = [('ASSIGN', '<-'), ('DARROW', '=>'), ('LE', '<=')]
+SINGLE_CHARACTERS = '+-*/~<=(){}:;.,@'
+
+WHITE_SPACE = ' \n\f\r\t\v'
+LOWER = 'abcdefghijklmnopqrstuvwxyz'
+UPPER = LOWER.upper()
+DIGITS = '0123456789'
+DOLLAR = '\0'  # stands for '$' in the rules
+ALPHABET = WHITE_SPACE + ''.join(chr(c) if chr(c) != '$' else DOLLAR
+                                 for c in range(32, 127))
+
+def one_of(characters):
+    """Union of single characters."""
+    return reduce(lambda x, y: x + y, map(Char, sorted(set(characters))))
+
+def literal(word):
+    """Concatenation of the characters of a word."""
+    return reduce(lambda x, y: x * y, map(Char, word))
+
+def case_insensitive(word):
+    """Concatenation matching a word in any case."""
+    return reduce(lambda x, y: x * y, [Char(c) + Char(c.upper()) for c in word])
+
+def plus(expression):
+    """One or more repetitions."""
+    return expression * expression.star()
+
+def rules():
+    """Return the (ordered) rules of the COOL lexer."""
+    identifier = one_of(LOWER + UPPER + DIGITS + '_').star()
+    string_character = (one_of(set(ALPHABET) - set('"\\\n')) +
+                        Char('\\') * one_of(ALPHABET))
+
+    out = [(word.upper(), case_insensitive(word)) for word in KEYWORDS]
+    out.extend([('BOOL_CONST', Char('t') * case_insensitive('rue')),
+                ('BOOL_CONST', Char('f') * case_insensitive('alse')),
+                ('INT_CONST', plus(one_of(DIGITS))),
+                ('TYPEID', one_of(UPPER) * identifier),
+                ('OBJECTID', one_of(LOWER) * identifier),
+                ('STR_CONST', Char('"') * string_character.star() * Char('"')),
+                ('COMMENT', literal('(*')),
+                ('UNMATCHED_COMMENT', literal('*)')),
+                ('LINE_COMMENT', literal('--')),
+                ('WHITE_SPACE', plus(one_of(WHITE_SPACE)))])
+    out.extend((name, literal(operator)) for name, operator in OPERATORS)
+    out.extend((c, Char(c)) for c in SINGLE_CHARACTERS)
+
+    return out
+
+def _nested_comment(text, end):
+    """Return the end of a (nested) comment whose opening ends at end."""
+    depth, pos = 1, end
+    while depth:
+        opening, closing = text.find('(*', pos), text.find('*)', pos)
+        if closing < 0:
+            raise ValueError('EOF in comment.')
+        if 0 <= opening < closing:
+            depth, pos = depth + 1, opening + 2
+        else:
+            depth, pos = depth - 1, closing + 2
+
+    return pos
+
+def _line_comment(text, end):
+    """Return the end of the line of a comment whose opening ends at end."""
+    pos = text.find('\n', end)
+
+    return len(text) if pos < 0 else pos
+
+def _unmatched_comment(text, end):
+    raise ValueError('Unmatched *) at offset {}.'.format(end - 2))
+
+@lru_cache(maxsize=None)
+def cool_lexer():
+    """Return the COOL lexer (its DFA is built on the first call only)."""
+    return Lexer(rules(),
+                 skip=['COMMENT', 'LINE_COMMENT', 'WHITE_SPACE'],
+                 handlers={'COMMENT': _nested_comment,
+                           'LINE_COMMENT': _line_comment,
+                           'UNMATCHED_COMMENT': _unmatched_comment},
+                 aliases={'$': DOLLAR})
+
+def tokenize(text):
+    """Generate the tokens of a COOL source (see :meth:`lexer.Lexer.tokenize`)."""
+    return cool_lexer().tokenize(text)
+
+def tokenize_file(filename):
+    """Generate the tokens of a COOL source file."""
+    with open(filename) as h:
+        text = h.read()
+
+    return tokenize(text)
@@ -0,0 +1,161 @@
+"""Match an automaton against a corpus of files with a pool of processes.
+
+Note
+-----
+The transition table and the accepting states of the (compiled) DFA are
+published once in a :class:`multiprocessing.shared_memory.SharedMemory`
+block: the workers attach to it when they start and build a
+:class:`matchers.CompiledDFA` on top of it, so the automaton is neither
+pickled nor copied for each file.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import os
+
+from matchers import CompiledDFA, read_chunks
+
+# set in each worker by _attach
+_matcher = None
+_shm = None
+
+def match_corpus(automaton, paths, workers=None, offsets=False,
+                 chunk_size=1 << 20):
+    """Match an automaton against files in parallel.
+
+    Parameters
+    -----------
+    automaton : :obj:`automaton.Automaton` or :obj:`matchers.CompiledDFA`
+        The automaton (nondeterministic automata are determinized first).
+
+    paths : iterable of :obj:`str`
+        Files to match (each byte is a letter, see :func:`matchers.read_chunks`).
+
+    workers : :obj:`int`
+        Number of processes (default: number of CPUs). With 1 worker the
+        files are matched in the current process.
+
+    offsets : :obj:`bool`
+        Return the offsets of all accepted prefixes instead of whether the
+        whole file is accepted.
+
+    chunk_size : :obj:`int`
+        Size (in bytes) of the chunks read from the files.
+
+    Yields
+    -------
+    :obj:`tuple`
+        (path, accepted) or (path, list of offsets), in completion order.
+
+    Note
+    -----
+    Files are grouped in batches of balanced total size (largest files
+    first), a few batches per worker, so that workers finish at about the
+    same time without a round-trip to the pool for every small file.
+    """
+    matcher = _compile(automaton)
+    paths = list(paths)
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    if workers < 1:
+        raise ValueError('The number of workers should be positive.')
+
+    if workers == 1 or len(paths) < 2:
+        for path in paths:
+            yield path, _match_file(matcher, path, offsets, chunk_size)
+        return
+
+    shm = publish(matcher)
+    try:
+        with ProcessPoolExecutor(workers, initializer=_attach,
+                                 initargs=(shm.name, matcher.alphabet,
+                                           matcher.n_states, matcher.start)) as pool:
+            futures = [pool.submit(_match_batch, batch, offsets, chunk_size)
+                       for batch in balanced_batches(paths, 4 * workers)]
+            try:
+                for future in as_completed(futures):
+                    yield from future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+    finally:
+        shm.close()
+        shm.unlink()
+
+def publish(matcher):
+    """Copy the transition table and the accepting states to shared memory.
+
+    Returns
+    --------
+    :obj:`multiprocessing.shared_memory.SharedMemory`
+        The table (native int32) followed by the accepting flags.
+
+    """
+    size = 4 * len(matcher.table)
+    shm = shared_memory.SharedMemory(create=True,
+                                     size=max(1, size + matcher.n_states))
+    shm.buf[:size] = memoryview(matcher.table).cast('B')
+    shm.buf[size:size + matcher.n_states] = matcher.accepting
+
+    return shm
+
+def balanced_batches(paths, n_batches):
+    """Split files in batches of about the same total size.
+
+    Note
+    -----
+    Greedy longest-processing-time rule: the files sorted by decreasing
+    size are added one by one to the lightest batch.
+    """
+    sizes = [(os.path.getsize(path), path) for path in paths]
+    sizes.sort(key=lambda item: item[0], reverse=True)
+
+    batches = [[] for _ in range(min(n_batches, len(paths)))]
+    loads = [0] * len(batches)
+    for size, path in sizes:
+        i = loads.index(min(loads))
+        batches[i].append(path)
+        loads[i] += size + 1  # +1: empty files are not free
+
+    return batches
+
+def _compile(automaton):
+    if isinstance(automaton, CompiledDFA):
+        return automaton
+
+    try:
+        return automaton.compile()
+    except ValueError:
+        return automaton.to_dfa().compile()
+
+def _attach(name, alphabet, n_states, start):
+    """Build the matcher of a worker on top of the shared memory."""
+    global _matcher, _shm
+    _shm = shared_memory.SharedMemory(name=name)  # unlinked by the parent process
+
+    size = 4 * n_states * len(alphabet)
+    table = _shm.buf[:size].cast('i')
+    accepting = bytes(_shm.buf[size:size + n_states])
+    _matcher = CompiledDFA(alphabet, table, start, accepting)
+
+def _match_batch(paths, offsets, chunk_size):
+    return [(path, _match_file(_matcher, path, offsets, chunk_size))
+            for path in paths]
+
+def _match_file(matcher, path, offsets, chunk_size):
+    """Return whether a file is accepted (or the offsets of accepted prefixes)."""
+    if offsets:
+        return list(matcher.scan(read_chunks(path, chunk_size)))
+
+    # the length is counted while reading (st_size is 0 for pipes)
+    size = [0]
+    def counted(chunks):
+        for chunk in chunks:
+            size[0] += len(chunk)
+            yield chunk
+
+    chunks = counted(read_chunks(path, chunk_size))
+    last = -1
+    for last in matcher.scan(chunks):
+        pass
+
+    # the scan may stop early (dead state) before the end of the file
+    return last == size[0] and next(chunks, None) is None
@@ -1,9 +1,10 @@
 """Example of an expression tree."""
-import os
-import subprocess
-from IPython.display import Image, display
+import io
+from itertools import count
+import weakref
 
 import utils
+from automaton import State, Automaton
 
 def postfix2tree(postfix):
     def token_type(character):
@@ -27,18 +28,150 @@ def postfix2tree(postfix):
     return stack[0]
 
 def expr(infix):
-    infix = utils.add_explicit_concatenation(infix)
-    postfix = utils.infix2postfix(infix,
-                                  priority={'*': 2, '.': 1, '+': 0})
+    priority = {'*': 2, '.': 1, '+': 0}
+    infix = utils.add_explicit_concatenation(infix, ''.join(priority))
+    postfix = utils.infix2postfix(infix, priority=priority)
 
     return postfix2tree(postfix)
 
+def glushkov(expression, name='G'):
+    """Return the position automaton of an expression (Glushkov's construction).
+
+    Note
+    -----
+    There is one state per occurrence of a letter (named after its position,
+    starting from 1) and an initial state '0'. A state is entered only upon
+    the letter of its position and there are no epsilon transitions.
+    """
+    letters, follow = [None], [set()]
+
+    # (nullable, first, last) of the subexpressions, the sets are updated in place
+    stack = []
+    for node in expression.postorder():
+        if isinstance(node, Char):
+            if node.value == '$':
+                raise ValueError("The letter '$' denotes epsilon transitions.")
+            letters.append(node.value)
+            follow.append(set())
+            p = len(letters) - 1
+            stack.append((False, {p}, {p}))
+        elif isinstance(node, Star):
+            _, first, last = stack.pop()
+            for p in last:
+                follow[p].update(first)
+            stack.append((True, first, last))
+        elif isinstance(node, (Empty, Epsilon)):
+            stack.append((isinstance(node, Epsilon), set(), set()))
+        else:
+            nullable2, first2, last2 = stack.pop()
+            nullable1, first1, last1 = stack.pop()
+            if isinstance(node, Add):
+                first1 |= first2
+                last1 |= last2
+                stack.append((nullable1 or nullable2, first1, last1))
+            else:
+                for p in last1:
+                    follow[p].update(first2)
+                if nullable1:
+                    first1 |= first2
+                if nullable2:
+                    last2 |= last1
+                stack.append((nullable1 and nullable2, first1, last2))
+
+    nullable, first, last = stack.pop()
+    follow[0] = first
+
+    Q = [State(str(p)) for p in range(len(letters))]
+    for p, targets in enumerate(follow):
+        for q in sorted(targets):
+            Q[p].add_transition(letters[q], Q[q])
+
+    F = [Q[p] for p in sorted(last)]
+    if nullable:
+        F.insert(0, Q[0])
+
+    return Automaton(name, Q, sorted(set(letters[1:])), Q[0], F)
+
 class Expression:
+    """Node of an expression tree.
+
+    Note
+    -----
+    Nodes are immutable and hash-consed: constructing a node that is
+    structurally equal to an existing one returns the existing object, so
+    equality is identity and the (structural) hash is computed only once.
+    """
+    __slots__ = ('_hash', '_serial', '_nullable', '__weakref__')
+    _fields = ()
+    _interned = weakref.WeakValueDictionary()
+    _counter = count()
+
+    def __new__(cls, *fields):
+        key = (cls,) + fields
+        node = Expression._interned.get(key)
+        if node is None:
+            node = object.__new__(cls)
+            for name, value in zip(cls._fields, fields):
+                object.__setattr__(node, name, value)
+            object.__setattr__(node, '_hash', hash(key))
+            object.__setattr__(node, '_serial', next(Expression._counter))
+            object.__setattr__(node, '_nullable', None)
+            Expression._interned[key] = node
+
+        return node
+
+    def __hash__(self):
+        return self._hash
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Expression nodes are immutable.')
+
+    def __delattr__(self, name):
+        raise AttributeError('Expression nodes are immutable.')
+
+    def __reduce__(self):
+        return (type(self), tuple(getattr(self, name) for name in self._fields))
+
     def description(self):
         raise NotImplementedError
 
+    def children(self):
+        """Return the operands of the node."""
+        return ()
+
     def postfix(self):
-        raise NotImplementedError
+        """Return the expression in postfix format."""
+        return ''.join(node.description() for node in self.postorder())
+
+    def preorder(self):
+        """Generate the nodes of the tree in pre-order (explicit stack).
+
+        Note
+        -----
+        Shared subtrees are generated once for each of their occurrences.
+        """
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children()))
+
+    def postorder(self):
+        """Generate the nodes of the tree in post-order (explicit stack).
+
+        Note
+        -----
+        Shared subtrees are generated once for each of their occurrences.
+        """
+        stack = [(self, False)]
+        while stack:
+            node, expanded = stack.pop()
+            children = node.children()
+            if expanded or not children:
+                yield node
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(children))
 
     def __add__(self, other):
         return Add(self, other)
@@ -50,114 +183,375 @@ class Expression:
         """Defines a star operator."""
         return Star(self)
 
+    def nullable(self):
+        """Return `True` if the empty word belongs to the language.
+
+        Note
+        -----
+        The result is memoized in the (hash-consed) nodes and the operands
+        are evaluated first with an explicit stack (no recursion).
+        """
+        stack = [self]
+        while stack:
+            node = stack[-1]
+            if node._nullable is not None:
+                stack.pop()
+                continue
+            pending = [e for e in node.children() if e._nullable is None]
+            if pending:
+                stack.extend(pending)
+            else:
+                object.__setattr__(node, '_nullable', node._is_nullable())
+                stack.pop()
+
+        return self._nullable
+
+    def _is_nullable(self):
+        """Return `nullable` from the (already evaluated) operands."""
+        raise NotImplementedError
+
+    def derivative(self, letter):
+        """Return the (Brzozowski) derivative with respect to a letter.
+
+        Note
+        -----
+        The result is simplified with :func:`union`, :func:`concatenation` and
+        :func:`kleene_star`, which makes the set of iterated derivatives of an
+        expression finite. The derivatives of the operands are computed first
+        with an explicit stack (see :func:`_evaluate`).
+        """
+        return _evaluate(self, lambda node: node._derivative_operands(),
+                         lambda node, d: node._derivative(letter, d))
+
+    def _derivative_operands(self):
+        """Return the operands whose derivatives are needed."""
+        return self.children()
+
+    def _derivative(self, letter, d):
+        """Return the derivative given those of the operands (`d[operand]`)."""
+        raise NotImplementedError
+
+    def matcher(self):
+        """Return a matcher based on derivatives (see :class:`DerivativeMatcher`)."""
+        return DerivativeMatcher(self)
+
     def get_nodes(self):
-        """Return a list of nodes in the tree."""
-        nodes = set([self])
-        if hasattr(self, 'left'):
-            nodes = nodes.union(self.left.get_nodes())
-
-        if hasattr(self, 'right'):
-            nodes = nodes.union(self.right.get_nodes())
-        return nodes
-
-    def show(self, filename=None, rankdir='TB'):
-        """Display a dot diagram."""
-        if filename is None:
-            filename = '_expr.png'
-        tmp_name, extension = os.path.splitext(os.path.basename(filename))
-        extension = extension[1:]
-
-        with open(tmp_name + '.dot', 'w') as h:
-            h.write(self._to_dot(rankdir))
-
-        subprocess.call(['dot',
-                         '-T{}'.format(extension),
-                         tmp_name + '.dot',
-                         '-o',
-                         filename])
-        subprocess.call(['rm', tmp_name + '.dot'])
-        display(Image(filename))
-
-
-    def _to_dot(self, rankdir='TB', dpi=100):
-        """Generate graphviz dot diagram."""
-        dot_str = 'digraph Expression {\n'
-        dot_str += 'graph [dpi={}]\n'.format(dpi)
-        dot_str += 'edge [arrowhead="empty"]\n'
-        dot_str += 'rankdir={}\n'.format(rankdir)
-
-        node_names = dict()
-        nodes = self.get_nodes()
-        for node in nodes:
-            node_names[node] = '{}'.format(len(node_names))
-            dot_str += '"{}"[label="{}", shape=circle]\n'.format(node_names[node],
-                                                                 node.description())
-
-        for node in nodes:
-            if hasattr(node, 'left'):
-                dot_str += '"{}" -> "{}"\n'.format(node_names[node],
-                                                   node_names[node.left])
-
-            if hasattr(node, 'right'):
-                dot_str += '"{}" -> "{}"\n'.format(node_names[node],
-                                                   node_names[node.right])
-
-        dot_str += '}\n'
-
-        return dot_str
+        """Return the set of (distinct) nodes in the tree.
+
+        Note
+        -----
+        Shared subtrees are visited once (see :func:`utils.distinct_preorder`).
+        """
+        return set(utils.distinct_preorder(self))
+
+    def show(self, filename=None, rankdir='TB', **options):
+        """Display a dot diagram (see :func:`visualization.show`)."""
+        import visualization
+
+        visualization.show(self, '_expr.png' if filename is None else filename,
+                           rankdir=rankdir, **options)
+
+    def _to_dot(self, rankdir='TB', dpi=100, **options):
+        """Generate graphviz dot diagram (see :meth:`write_dot`)."""
+        out = io.StringIO()
+        self.write_dot(out, rankdir, dpi, **options)
+
+        return out.getvalue()
+
+    def write_dot(self, stream, rankdir='TB', dpi=100, max_nodes=None):
+        """Write the dot diagram to a text stream (see :func:`utils.write_tree_dot`)."""
+        utils.write_tree_dot(stream, self, lambda node: node.description(),
+                             rankdir, dpi, max_nodes, name='Expression')
 
 class Char(Expression):
     """A character class."""
-    def __init__(self, value):
-        self.value = value
+    __slots__ = ('value',)
+    _fields = ('value',)
 
     def description(self):
+        return self.value
+
+    def _is_nullable(self):
+        return False
+
+    def _derivative(self, letter, d):
+        return EPSILON if letter == self.value else EMPTY
+
+    def __repr__(self):
         return self.postfix()
 
-    def postfix(self):
-        return self.value
+class Empty(Expression):
+    """The empty language."""
+    __slots__ = ()
 
-    def get_nodes(self):
-        return set([self])
+    def description(self):
+        return '\u2205'
+
+    def _is_nullable(self):
+        return False
+
+    def _derivative(self, letter, d):
+        return EMPTY
+
+    def __repr__(self):
+        return self.postfix()
+
+class Epsilon(Expression):
+    """The language of the empty word."""
+    __slots__ = ()
+
+    def description(self):
+        return '\u03b5'
+
+    def _is_nullable(self):
+        return True
+
+    def _derivative(self, letter, d):
+        return EMPTY
 
     def __repr__(self):
         return self.postfix()
 
+EMPTY, EPSILON = Empty(), Epsilon()
+
 class Operator(Expression):
+    __slots__ = ()
+
     def __repr__(self):
         return 'expr: ' + self.postfix()
 
 class BinaryOperator(Operator):
-    def __init__(self, left, right):
-        self.left, self.right = left, right
+    __slots__ = ('left', 'right')
+    _fields = ('left', 'right')
 
-    def postfix(self):
-        return self.left.postfix() + self.right.postfix() + self.description()
+    def children(self):
+        return (self.left, self.right)
 
 class UnaryOperator(Operator):
-    def __init__(self, right):
-        self.right = right
+    __slots__ = ('right',)
+    _fields = ('right',)
 
-    def postfix(self):
-        return self.right.postfix() + self.description()
+    def children(self):
+        return (self.right,)
 
 class Star(UnaryOperator):
-    def __init__(self, right):
-        super().__init__(right)
+    __slots__ = ()
 
     def description(self):
         return '*'
 
+    def _is_nullable(self):
+        return True
+
+    def _derivative(self, letter, d):
+        return concatenation(d[self.right], self)
+
 class Multiply(BinaryOperator):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
 
     def description(self):
         return '.'
 
+    def _is_nullable(self):
+        return self.left.nullable() and self.right.nullable()
+
+    def _derivative_operands(self):
+        return self.children() if self.left.nullable() else (self.left,)
+
+    def _derivative(self, letter, d):
+        out = concatenation(d[self.left], self.right)
+        if self.left.nullable():
+            return union(out, d[self.right])
+
+        return out
+
 class Add(BinaryOperator):
-    def __init__(self, left, right):
-        super().__init__(left, right)
+    __slots__ = ()
 
     def description(self):
         return '+'
+
+    def _is_nullable(self):
+        return self.left.nullable() or self.right.nullable()
+
+    def _derivative(self, letter, d):
+        return union(d[self.left], d[self.right])
+
+def union(expr1, expr2):
+    """Return the simplified union of two expressions.
+
+    Note
+    -----
+    Unions are flattened, sorted and without duplicates or empty terms
+    (associativity, commutativity and idempotence). Terms are sorted in
+    order of creation of the (hash-consed) nodes.
+    """
+    terms, stack = set(), [expr1, expr2]
+    while stack:
+        e = stack.pop()
+        if isinstance(e, Add):
+            stack.extend((e.left, e.right))
+        elif not isinstance(e, Empty):
+            terms.add(e)
+
+    if not terms:
+        return EMPTY
+
+    ordered = sorted(terms, key=lambda e: e._serial)
+    out = ordered[0]
+    for e in ordered[1:]:
+        out = Add(out, e)
+
+    return out
+
+def concatenation(expr1, expr2):
+    """Return the simplified (right-associative) concatenation of two expressions.
+
+    Note
+    -----
+    The factors of expr1 (see :func:`_factors`) are prepended to expr2 one by
+    one, from the last one.
+    """
+    out = expr2
+    for e in reversed(_factors(expr1)):
+        if isinstance(e, Empty) or isinstance(out, Empty):
+            return EMPTY
+        if isinstance(out, Epsilon):
+            out = e
+        elif not isinstance(e, Epsilon):
+            out = Multiply(e, out)
+
+    return out
+
+def _factors(expression):
+    """Return the operands of nested concatenations (in order, explicit stack)."""
+    factors, stack = [], [expression]
+    while stack:
+        e = stack.pop()
+        if isinstance(e, Multiply):
+            stack.extend((e.right, e.left))
+        else:
+            factors.append(e)
+
+    return factors
+
+def kleene_star(expr1):
+    """Return the simplified star of an expression."""
+    if isinstance(expr1, Star):
+        return expr1
+    if isinstance(expr1, (Empty, Epsilon)):
+        return EPSILON
+
+    return Star(expr1)
+
+def simplify(expression):
+    """Return an expression rebuilt with the simplification rules.
+
+    Note
+    -----
+    See :func:`union`, :func:`concatenation` and :func:`kleene_star`. Nested
+    concatenations are rebuilt at once from their factors, so a long chain
+    (e.g., left-associative) is simplified in linear time.
+    """
+    def operands(node):
+        return _factors(node) if isinstance(node, Multiply) else node.children()
+
+    def rebuild(node, s):
+        if isinstance(node, Add):
+            return union(s[node.left], s[node.right])
+        if isinstance(node, Multiply):
+            out = EPSILON
+            for e in reversed(_factors(node)):
+                out = concatenation(s[e], out)
+            return out
+        if isinstance(node, Star):
+            return kleene_star(s[node.right])
+
+        return node
+
+    return _evaluate(expression, operands, rebuild)
+
+def _evaluate(root, operands, evaluate):
+    """Evaluate the nodes of an expression bottom-up (explicit stack).
+
+    Parameters
+    -----------
+    root : :obj:`Expression`
+        The evaluated expression.
+
+    operands : :obj:`callable`
+        Return the operands of a node whose values are needed.
+
+    evaluate : :obj:`callable`
+        Return the value of a node given the dictionary of the values of the
+        nodes evaluated so far (including its operands).
+
+    Note
+    -----
+    Each (distinct) node is evaluated once, also when it is shared.
+    """
+    values, stack = dict(), [root]
+    while stack:
+        node = stack[-1]
+        if node in values:
+            stack.pop()
+            continue
+        pending = [e for e in operands(node) if e not in values]
+        if pending:
+            stack.extend(pending)
+        else:
+            values[node] = evaluate(node, values)
+            stack.pop()
+
+    return values[root]
+
+class DerivativeMatcher:
+    """Matcher whose states are the derivatives of an expression.
+
+    Note
+    -----
+    States and transitions are created on demand and memoized, so the
+    matcher is a DFA built lazily while matching (no subset construction).
+    """
+    def __init__(self, expression):
+        """Constructor.
+
+        Parameters
+        -----------
+        expression : :obj:`Expression`
+            The expression to match.
+
+        """
+        expression = simplify(expression)
+        self.states = [expression]  # state id -> expression
+        self.ids = {expression: 0}
+        self.accepting = [expression.nullable()]
+        self.transitions = dict()  # (state id, letter) -> state id
+
+    def step(self, state, letter):
+        """Return the state reached from a state upon a letter."""
+        target = self.transitions.get((state, letter))
+        if target is None:
+            d = self.states[state].derivative(letter)
+            target = self.ids.get(d)
+            if target is None:
+                target = self.ids[d] = len(self.states)
+                self.states.append(d)
+                self.accepting.append(d.nullable())
+            self.transitions[(state, letter)] = target
+
+        return target
+
+    def fullmatch(self, string):
+        """Return `True` if the whole string is accepted."""
+        state = 0
+        for letter in string:
+            state = self.step(state, letter)
+            if isinstance(self.states[state], Empty):
+                return False
+
+        return self.accepting[state]
+
+    def __repr__(self):
+        """Describe object."""
+        return 'DerivativeMatcher: {} states'.format(len(self.states))
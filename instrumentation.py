@@ -0,0 +1,145 @@
+"""Instrumentation of the automata (counters, timing and tracing).
+
+Hooks are called only when a tracer is installed: with the default
+(`tracer = None`) the cost of a hook is a single `is None` check, and no
+message is formatted.
+
+Example
+--------
+with tracing(Counters()) as counters:
+    M.transition('a')
+print(counters)
+"""
+from contextlib import contextmanager
+import logging
+
+tracer = None
+
+class Tracer:
+    """Base class of tracers (all events are ignored).
+
+    Note
+    -----
+    Subclasses override the events they are interested in.
+    """
+    def transition(self, letter, seconds):
+        """A letter has been consumed by :meth:`automaton.Automaton.transition`."""
+
+    def activate(self, state):
+        """A state has been activated."""
+
+    def deactivate(self, state, where):
+        """A state has been deactivated (`where` describes the reason)."""
+
+    def closures(self, n):
+        """n epsilon closures have been computed."""
+
+    def dfa_states(self, n):
+        """n DFA states have been created (subset construction or lazy DFA)."""
+
+class Counters(Tracer):
+    """Count the events.
+
+    Attributes
+    -----------
+    letters : :obj:`int`
+        Letters consumed.
+
+    activations, deactivations : :obj:`int`
+        States activated and deactivated.
+
+    n_closures : :obj:`int`
+        Epsilon closures computed.
+
+    n_dfa_states : :obj:`int`
+        DFA states created.
+
+    seconds : :obj:`float`
+        Total duration of the transitions.
+
+    steps : :obj:`list(tuple)`
+        (letter, duration) of every transition, if `record_steps` is `True`.
+
+    """
+    def __init__(self, record_steps=False):
+        self.letters = self.activations = self.deactivations = 0
+        self.n_closures = self.n_dfa_states = 0
+        self.seconds = 0.0
+        self.steps = [] if record_steps else None
+
+    def transition(self, letter, seconds):
+        self.letters += 1
+        self.seconds += seconds
+        if self.steps is not None:
+            self.steps.append((letter, seconds))
+
+    def activate(self, state):
+        self.activations += 1
+
+    def deactivate(self, state, where):
+        self.deactivations += 1
+
+    def closures(self, n):
+        self.n_closures += n
+
+    def dfa_states(self, n):
+        self.n_dfa_states += n
+
+    def __repr__(self):
+        """Describe object."""
+        return ('Counters: {} letters ({:.6f} s), {} activations, {} deactivations, '
+                '{} closures, {} DFA states'.format(self.letters, self.seconds,
+                                                    self.activations,
+                                                    self.deactivations,
+                                                    self.n_closures,
+                                                    self.n_dfa_states))
+
+class LogTracer(Tracer):
+    """Log the activity of the states (at level INFO of the `automaton` logger)."""
+    def __init__(self, logger=None):
+        self.log = logging.getLogger('automaton') if logger is None else logger
+
+    def transition(self, letter, seconds):
+        self.log.info('transition with letter %s (%.6f s)', letter, seconds)
+
+    def activate(self, state):
+        self.log.info('activate: %s', state.name)
+
+    def deactivate(self, state, where):
+        self.log.info('deactivate: %s (%s)', state.name, where)
+
+class CallbackTracer(Tracer):
+    """Forward all events to a callable `f(event, *args)`."""
+    def __init__(self, callback):
+        self.callback = callback
+
+    def transition(self, letter, seconds):
+        self.callback('transition', letter, seconds)
+
+    def activate(self, state):
+        self.callback('activate', state)
+
+    def deactivate(self, state, where):
+        self.callback('deactivate', state, where)
+
+    def closures(self, n):
+        self.callback('closures', n)
+
+    def dfa_states(self, n):
+        self.callback('dfa_states', n)
+
+def install(new_tracer):
+    """Install a tracer (`None` disables the hooks) and return the previous one."""
+    global tracer
+    previous, tracer = tracer, new_tracer
+
+    return previous
+
+@contextmanager
+def tracing(new_tracer):
+    """Install a tracer within a `with` block."""
+    previous = install(new_tracer)
+    try:
+        yield new_tracer
+    finally:
+        install(previous)
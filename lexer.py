@@ -0,0 +1,125 @@
+"""Multi-pattern longest-match tokenizer."""
+from collections import namedtuple
+
+from automaton import Automaton, ThompsonConstruction
+import regexp
+
+Token = namedtuple('Token', ['token', 'lexeme', 'line', 'column'])
+
+class Lexer:
+    """Tokenizer based on a single DFA for all rules.
+
+    Note
+    -----
+    The NFAs of the rules (Thompson's construction) are joined by epsilon
+    transitions from a common initial state and determinized with
+    :meth:`automaton.Automaton.to_dfa`. An accepting DFA state is labeled
+    with the first rule whose accepting NFA state it contains. Tokenization
+    uses maximal munch: the longest lexeme wins, ties go to the earlier rule.
+    """
+    def __init__(self, rules, skip=(), handlers=None, aliases=None):
+        """Constructor.
+
+        Parameters
+        -----------
+        rules : :obj:`list(tuple)`
+            Ordered pairs (token name, pattern), where a pattern is a
+            :obj:`str` (see :mod:`regexp`) or an
+            :obj:`expression_tree.Expression`.
+
+        skip : :obj:`list(str)`
+            Names of the tokens that are not yielded (e.g., white space).
+
+        handlers : :obj:`dict`
+            Token name -> callable `f(text, end)` returning the end of the
+            lexeme whose matched part ends at `end`. Used to consume
+            constructs that are not regular (e.g., nested comments).
+
+        aliases : :obj:`dict`
+            Character of the text -> letter of the rules that stands for it
+            (e.g., for '$', which denotes epsilon transitions in
+            :mod:`automaton`). The letter itself is no longer matched.
+
+        """
+        self.names = [name for name, _ in rules]
+        self.skip = frozenset(skip)
+        self.handlers = dict() if handlers is None else dict(handlers)
+
+        thompson = ThompsonConstruction()
+        initial_state = thompson.state_register.new_state()
+        Sigma, out_states = set(), dict()
+        for priority, (name, pattern) in enumerate(rules):
+            if isinstance(pattern, str):
+                postfix = regexp.to_postfix(pattern)
+                expr = regexp.postfix2fragment(postfix, thompson)
+                Sigma.update(set(postfix) - set(regexp.PRIORITY))
+            else:
+                expr = regexp.expression2fragment(pattern, thompson)
+                Sigma.update(regexp.letters(pattern))
+            initial_state.add_transition('$', expr['initial_state'])
+            out_states[expr['out_state'].name] = priority
+
+        Q = thompson.state_register.registered_states
+        nfa = Automaton('L', Q, sorted(Sigma), initial_state,
+                        [s for s in Q if s.name in out_states])
+        dfa = nfa.to_dfa()
+
+        self.dfa = dfa.compile()
+        self.live = self.dfa.live_states()
+        self.ids = dict(self.dfa.letter_ids)
+        for character, letter in (aliases or dict()).items():
+            if letter in self.ids:
+                self.ids[character] = self.ids.pop(letter)
+        self.rule = [min((out_states[name] for name in state.ready
+                          if name in out_states), default=-1)
+                     for state in dfa.Q]
+
+    def tokenize(self, text):
+        """Generate the tokens of a text.
+
+        Yields
+        -------
+        :obj:`Token`
+            Token name, lexeme, line and column (both starting at 1).
+
+        """
+        table, n, ids = self.dfa.table, self.dfa.n_letters, self.ids
+        live, rule, start = self.live, self.rule, self.dfa.start
+        pos, line, column, length = 0, 1, 1, len(text)
+        while pos < length:
+            state, i, last_rule, last_end = start, pos, -1, pos
+            while i < length:
+                j = ids.get(text[i])
+                if j is None:
+                    break
+                state = table[state * n + j]
+                if state < 0 or not live[state]:
+                    break
+                i += 1
+                if rule[state] >= 0:
+                    last_rule, last_end = rule[state], i
+
+            if last_rule < 0:
+                raise ValueError('Unexpected character {!r} at line {}, '
+                                 'column {}.'.format(text[pos], line, column))
+
+            name = self.names[last_rule]
+            if name in self.handlers:
+                last_end = self.handlers[name](text, last_end)
+
+            lexeme = text[pos:last_end]
+            if name not in self.skip:
+                yield Token(name, lexeme, line, column)
+
+            newlines = lexeme.count('\n')
+            if newlines:
+                line += newlines
+                column = len(lexeme) - lexeme.rfind('\n')
+            else:
+                column += len(lexeme)
+            pos = last_end
+
+    def __repr__(self):
+        """Describe object."""
+        return 'Lexer: {} rules, {} DFA states'.format(len(self.names),
+                                                       self.dfa.n_states)
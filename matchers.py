@@ -0,0 +1,1455 @@
+"""Matching engines operating on integer-numbered automata.
+
+The classes in this module do not touch :class:`~automaton.State` objects:
+they are built once from an :class:`~automaton.Automaton` and afterwards work
+only with integer state ids and letter ids.
+"""
+from array import array
+import json
+import mmap
+import os
+import stat
+import struct
+import sys
+import tempfile
+
+import instrumentation
+
+MAGIC = b'CDFA'
+FORMAT_VERSION = 1
+# magic, version, n_states, n_letters, start, size of the alphabet map (bytes)
+HEADER = struct.Struct('<4sHxxiiiI')
+# see chunk_mapping and CompiledDFA.match_many: below this number of runs a
+# python loop per run is faster than a numpy step of all the runs
+SCALAR_RUNS = 12
+# see chunk_mapping: DFAs with at most COMPOSE_STATES states (sink included)
+# compose the mappings of the letters, COMPOSE_CELLS mapping entries at a time
+COMPOSE_STATES = 128
+COMPOSE_CELLS = 1 << 20
+# size (in bytes) of the blocks of a chunk read at once by chunk_mapping
+BLOCK_SIZE = 1 << 16
+
+class CompiledDFA:
+    """Immutable matcher for a deterministic finate automaton.
+
+    Note
+    -----
+    The transition table is dense and flat: the successor of state `s` upon
+    the letter with id `j` is ``table[s * n_letters + j]`` (-1 if undefined).
+    """
+    __slots__ = ('alphabet', 'letter_ids', 'table', 'n_states', 'n_letters',
+                 'start', 'accepting', 'state_names', '_arrays', '_live')
+
+    def __init__(self, alphabet, table, start, accepting, state_names=None):
+        """Constructor.
+
+        Parameters
+        -----------
+        alphabet : :obj:`list(str)`
+            The alphabet (the position of a letter is its id).
+
+        table : :obj:`array`
+            Flat transition table of size `n_states * len(alphabet)`.
+
+        start : :obj:`int`
+            Id of the initial state.
+
+        accepting : :obj:`bytes`
+            Accepting-state flags (one byte per state, nonzero if accepting).
+
+        state_names : :obj:`list`
+            Names of the states in the original automaton (optional).
+
+        """
+        self.alphabet = tuple(alphabet)
+        self.letter_ids = {letter: j for j, letter in enumerate(self.alphabet)}
+        self.n_letters = len(self.alphabet)
+        self.n_states = len(accepting)
+        if len(table) != self.n_states * self.n_letters:
+            raise ValueError('Table size does not match states x letters.')
+
+        self.table = table
+        self.start = start
+        self.accepting = bytes(accepting)
+        self.state_names = None if state_names is None else tuple(state_names)
+        self._arrays = None
+        self._live = None
+
+    def step(self, state, letter):
+        """Return the successor of a state upon a letter (-1 if undefined)."""
+        j = self.letter_ids.get(letter)
+        if j is None or state < 0:
+            return -1
+
+        return self.table[state * self.n_letters + j]
+
+    def final_state(self, string):
+        """Return the state reached after consuming string (-1 if stuck)."""
+        table, n, ids = self.table, self.n_letters, self.letter_ids
+        state = self.start
+        for letter in string:
+            j = ids.get(letter)
+            if j is None:
+                return -1
+            state = table[state * n + j]
+            if state < 0:
+                return -1
+
+        return state
+
+    def fullmatch(self, string):
+        """Return `True` if the whole string is accepted."""
+        state = self.final_state(string)
+        return state >= 0 and self.accepting[state] != 0
+
+    def run(self, string):
+        """Return `True` if the whole string is accepted (see :meth:`fullmatch`)."""
+        return self.fullmatch(string)
+
+    def matches(self, string):
+        """Return `True` if a prefix of the string is accepted."""
+        table, n, ids, accepting = (self.table, self.n_letters,
+                                    self.letter_ids, self.accepting)
+        state = self.start
+        if accepting[state]:
+            return True
+
+        for letter in string:
+            j = ids.get(letter)
+            if j is None:
+                return False
+            state = table[state * n + j]
+            if state < 0:
+                return False
+            if accepting[state]:
+                return True
+
+        return False
+
+    def cursor(self):
+        """Return a new resumable cursor positioned at the initial state."""
+        return DFACursor(self)
+
+    def scan(self, chunks):
+        """Consume chunks of input and yield the offsets of accepted prefixes.
+
+        Parameters
+        -----------
+        chunks : iterable of :obj:`str` or :obj:`bytes`
+            Consecutive pieces of the input (a byte is a letter, see
+            :func:`read_chunks`).
+
+        Yields
+        -------
+        :obj:`int`
+            Number of letters consumed whenever the input read so far is
+            accepted. Scanning stops as soon as no prefix can be accepted.
+
+        """
+        table, n, ids, accepting = (self.table, self.n_letters,
+                                    self.letter_ids, self.accepting)
+        live = self.live_states()
+        state, offset = self.start, 0
+        if accepting[state]:
+            yield 0
+
+        for chunk in chunks:
+            if not live[state]:
+                return
+            for letter in as_letters(chunk):
+                j = ids.get(letter)
+                state = -1 if j is None else table[state * n + j]
+                offset += 1
+                if state < 0 or not live[state]:
+                    return
+                if accepting[state]:
+                    yield offset
+
+    def live_states(self):
+        """Return flags of the states from which an accepting state is reachable.
+
+        Note
+        -----
+        The flags (:obj:`bytes`) are computed on the first call only.
+        """
+        if self._live is None:
+            self._live = self._find_live_states()
+
+        return self._live
+
+    def _find_live_states(self):
+        n, m, table = self.n_states, self.n_letters, self.table
+        predecessors = [[] for _ in range(n)]
+        for s in range(n):
+            for t in table[s * m:(s + 1) * m]:
+                if t >= 0:
+                    predecessors[t].append(s)
+
+        live = bytearray(self.accepting)
+        stack = [s for s in range(n) if live[s]]
+        while stack:
+            for s in predecessors[stack.pop()]:
+                if not live[s]:
+                    live[s] = 1
+                    stack.append(s)
+
+        return bytes(live)
+
+    def match_many(self, strings, return_states=False):
+        """Match a batch of strings at once (vectorized with numpy).
+
+        Parameters
+        -----------
+        strings : :obj:`list(str)`
+            Strings to match (letters of the alphabet must be characters).
+
+        return_states : :obj:`bool`
+            Return also the final state ids (-1 for a rejected prefix).
+
+        Returns
+        --------
+        :obj:`numpy.ndarray` of booleans (and of final state ids, if requested)
+
+        Note
+        -----
+        The strings are sorted by length, so step `t` only advances the
+        strings longer than `t` (a suffix of the sorted batch): the memory is
+        linear in the total length of the strings and a long string does not
+        make the others pay for its steps. Once at most :obj:`SCALAR_RUNS`
+        strings remain they are completed without numpy.
+        """
+        import numpy as np
+
+        table, accepting, lookup = self._numpy_arrays()
+        n = self.n_states
+        strings = list(strings)
+        lengths = np.fromiter(map(len, strings), dtype=np.intp, count=len(strings))
+        width = int(lengths.max()) if len(strings) else 0
+
+        letters = np.frombuffer(''.join(strings).encode('utf-32-le'), dtype='<u4')
+        letters = lookup[np.minimum(letters, len(lookup) - 1)]
+        offsets = np.zeros(len(strings), dtype=np.intp)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+
+        order = np.argsort(lengths, kind='stable')
+        positions, ends = offsets[order], (offsets + lengths)[order]
+        # the strings of length > t are the ones from firsts[t] on
+        firsts = np.searchsorted(lengths[order], np.arange(width), side='right')
+
+        state = np.full(len(strings), self.start, dtype=np.intp)
+        for t, first in enumerate(firsts):
+            if len(strings) - first <= SCALAR_RUNS:
+                # a few long strings remain: they are faster without numpy
+                for i in range(first, len(strings)):
+                    s = int(state[i])
+                    for j in letters[positions[i] + t:ends[i]].tolist():
+                        if s == n:
+                            break
+                        s = table.item(s, j)
+                    state[i] = s
+                break
+            state[first:] = table[state[first:], letters[positions[first:] + t]]
+
+        final = np.empty_like(state)
+        final[order] = state
+        accepted = accepting[final]
+        if return_states:
+            return accepted, np.where(final == n, -1, final)
+
+        return accepted
+
+    def _numpy_arrays(self):
+        """Return (and cache) the tables used by :meth:`match_many`."""
+        if self._arrays is None:
+            import numpy as np
+
+            if any(len(letter) != 1 for letter in self.alphabet):
+                raise ValueError('Batch matching requires single-character letters.')
+
+            n, m = self.n_states, self.n_letters
+            # row n is a rejecting sink state
+            table = np.full((n + 1, m + 2), n, dtype=np.int32)
+            dense = np.asarray(self.table, dtype=np.int32).reshape(n, m)
+            table[:n, :m] = np.where(dense < 0, n, dense)
+            table[:, m] = np.arange(n + 1)
+
+            accepting = np.zeros(n + 1, dtype=bool)
+            accepting[:n] = np.frombuffer(self.accepting, dtype=np.uint8) != 0
+
+            # character code -> letter id; id m pads shorter strings
+            # (self-loop) and id m + 1 marks an unknown letter
+            codes = [ord(letter) for letter in self.alphabet]
+            lookup = np.full(max(codes, default=0) + 2, m + 1, dtype=np.int32)
+            lookup[codes] = np.arange(m)
+            self._arrays = (table, accepting, lookup)
+
+        return self._arrays
+
+    def parallel_final_state(self, source, n_chunks=None, workers=1):
+        """Return the state reached after a (huge) input, processed in parallel.
+
+        Parameters
+        -----------
+        source : :obj:`str`, path or bytes-like object
+            A regular file given by its path (memory-mapped) or the input
+            itself; each byte is a letter (see :func:`read_chunks`).
+
+        n_chunks : :obj:`int`
+            Number of chunks the input is split into (default: `workers`).
+
+        workers : :obj:`int`
+            Number of processes. With 1 worker the chunks are processed in
+            the current process.
+
+        Returns
+        --------
+        :obj:`int`
+            The final state (-1 if a transition is undefined).
+
+        Note
+        -----
+        The start state of a chunk is known only when the previous chunks
+        have been processed, so every chunk is run from all states at once
+        (see :func:`chunk_mapping`) and the resulting state-to-state
+        mappings are composed in order. Chunks are read in blocks of
+        :obj:`BLOCK_SIZE` bytes, so the memory does not grow with the input.
+        """
+        mappings = self.chunk_mappings(source, n_chunks, workers)
+        state = self.start
+        for mapping in mappings:
+            state = int(mapping[state])
+
+        return -1 if state == self.n_states else state
+
+    def parallel_fullmatch(self, source, n_chunks=None, workers=1):
+        """Return `True` if the whole input is accepted (see :meth:`parallel_final_state`)."""
+        state = self.parallel_final_state(source, n_chunks, workers)
+        return state >= 0 and self.accepting[state] != 0
+
+    def chunk_mappings(self, source, n_chunks=None, workers=1):
+        """Return the state-to-state mappings of the chunks of an input.
+
+        Note
+        -----
+        See :meth:`parallel_final_state`. Mapping `k` gives the state after
+        chunk `k` for each state before it (state `n_states` is a rejecting
+        sink). The prefix compositions give the state at every chunk
+        boundary.
+        """
+        import numpy as np
+
+        table, _, lookup = self._numpy_arrays()
+        n_chunks = workers if n_chunks is None else n_chunks
+        if isinstance(source, (str, os.PathLike)):
+            st = os.stat(source)
+            if not stat.S_ISREG(st.st_mode):
+                raise ValueError('{} is not a regular file (chunks are read at '
+                                 'given offsets).'.format(source))
+            size = st.st_size
+        else:
+            source = memoryview(source).cast('B')
+            size = len(source)
+
+        bounds = [size * k // n_chunks for k in range(n_chunks + 1)]
+        chunks = [(source, begin, end) for begin, end in zip(bounds, bounds[1:])]
+        if workers == 1:
+            return [chunk_mapping(table, lookup, _read_chunk(*chunk))
+                    for chunk in chunks]
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(workers, initializer=_set_arrays,
+                                 initargs=(table, lookup)) as pool:
+            if not isinstance(source, memoryview):
+                return list(pool.map(_map_chunk, chunks))
+            # the data is sent to the workers: bytes can be pickled, views cannot
+            return list(pool.map(_map_chunk, [(bytes(source[begin:end]), 0, end - begin)
+                                              for _, begin, end in chunks]))
+
+    def save(self, path):
+        """Save the matcher in a versioned binary format (see :func:`load_dfa`).
+
+        Note
+        -----
+        The file consists of a header (:obj:`HEADER`), the alphabet map and the
+        state names (JSON), the accepting states (bitmap) and the transition
+        table (little-endian int32, aligned on 4 bytes). The file is written
+        to a temporary file first and then renamed, so readers never see a
+        partially written file.
+        """
+        names = None if self.state_names is None else list(map(str, self.state_names))
+        alphabet = json.dumps({'alphabet': self.alphabet,
+                               'state_names': names}).encode('utf-8')
+        bitmap = bytearray((self.n_states + 7) // 8)
+        for s, flag in enumerate(self.accepting):
+            if flag:
+                bitmap[s >> 3] |= 1 << (s & 7)
+
+        table = array('i', self.table)
+        if sys.byteorder != 'little':
+            table.byteswap()
+
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, self.n_states, self.n_letters,
+                             self.start, len(alphabet))
+        size = HEADER.size + len(alphabet) + len(bitmap)
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_name = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as h:
+                h.write(header)
+                h.write(alphabet)
+                h.write(bitmap)
+                h.write(bytes(-size % 4))
+                h.write(table.tobytes())
+            os.replace(tmp_name, path)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+    def __repr__(self):
+        """Describe object."""
+        return 'CompiledDFA: {} states, {} letters'.format(self.n_states,
+                                                           self.n_letters)
+
+class BitsetNFA:
+    """Immutable simulator for a nondeterministic finate automaton.
+
+    Note
+    -----
+    Sets of states are represented as integer bitmasks (bit `i` is state `i`).
+    Epsilon closures are folded into the masks, so a step is a bitwise OR of
+    precomputed successor masks over the currently active states.
+    """
+    __slots__ = ('alphabet', 'letter_ids', 'n_states', 'start', 'accept',
+                 'successors', 'movable', 'state_names')
+
+    def __init__(self, alphabet, start, accept, successors, state_names=None):
+        """Constructor.
+
+        Parameters
+        -----------
+        alphabet : :obj:`list(str)`
+            The alphabet (the position of a letter is its id).
+
+        start : :obj:`int`
+            Mask of the initial active states (epsilon closure included).
+
+        accept : :obj:`int`
+            Mask of the accepting states.
+
+        successors : :obj:`list(list(int))`
+            `successors[j][i]` is the mask of states active after state `i`
+            consumes letter `j` (epsilon closure included).
+
+        state_names : :obj:`list`
+            Names of the states in the original automaton (optional).
+
+        """
+        self.alphabet = tuple(alphabet)
+        self.letter_ids = {letter: j for j, letter in enumerate(self.alphabet)}
+        self.start = start
+        self.accept = accept
+        self.successors = tuple(tuple(row) for row in successors)
+        self.n_states = len(self.successors[0]) if self.successors else 0
+        # states with at least one transition for a given letter
+        self.movable = tuple(sum(1 << i for i, m in enumerate(row) if m)
+                             for row in self.successors)
+        self.state_names = None if state_names is None else tuple(state_names)
+
+    def step(self, active, letter):
+        """Return the mask of states reached from active upon a letter."""
+        j = self.letter_ids.get(letter)
+        if j is None:
+            return 0
+
+        return self._step(active, j)
+
+    def _step(self, active, j):
+        succ = self.successors[j]
+        active &= self.movable[j]
+        out = 0
+        while active:
+            low = active & -active
+            out |= succ[low.bit_length() - 1]
+            active ^= low
+
+        return out
+
+    def final_states(self, string):
+        """Return the mask of active states after consuming string."""
+        ids = self.letter_ids
+        active = self.start
+        for letter in string:
+            j = ids.get(letter)
+            if j is None:
+                return 0
+            active = self._step(active, j)
+            if not active:
+                return 0
+
+        return active
+
+    def run(self, string):
+        """Return `True` if the whole string is accepted."""
+        return self.final_states(string) & self.accept != 0
+
+    def fullmatch(self, string):
+        """Return `True` if the whole string is accepted (see :meth:`run`)."""
+        return self.run(string)
+
+    def matches(self, string):
+        """Return `True` if a prefix of the string is accepted."""
+        ids, accept = self.letter_ids, self.accept
+        active = self.start
+        for letter in string:
+            if active & accept:
+                return True
+            j = ids.get(letter)
+            if j is None:
+                return False
+            active = self._step(active, j)
+            if not active:
+                return False
+
+        return active & accept != 0
+
+    def scan(self, chunks):
+        """Consume chunks of input and yield the offsets of accepted prefixes.
+
+        Note
+        -----
+        See :meth:`CompiledDFA.scan`.
+        """
+        ids, accept = self.letter_ids, self.accept
+        active, offset = self.start, 0
+        if active & accept:
+            yield 0
+
+        for chunk in chunks:
+            for letter in as_letters(chunk):
+                j = ids.get(letter)
+                active = 0 if j is None else self._step(active, j)
+                offset += 1
+                if not active:
+                    return
+                if active & accept:
+                    yield offset
+
+    def cursor(self):
+        """Return a new resumable cursor positioned at the initial states."""
+        return NFACursor(self)
+
+    def determinize(self):
+        """Return an equivalent :obj:`CompiledDFA` (eager subset construction)."""
+        masks, table, accepting = subset_construction(self)
+        return CompiledDFA(self.alphabet, table, 0, accepting)
+
+    def names(self, active):
+        """Return the names (or ids) of the states in an active mask."""
+        out = []
+        while active:
+            low = active & -active
+            i = low.bit_length() - 1
+            out.append(i if self.state_names is None else self.state_names[i])
+            active ^= low
+
+        return out
+
+    def __repr__(self):
+        """Describe object."""
+        return 'BitsetNFA: {} states, {} letters'.format(self.n_states,
+                                                         len(self.alphabet))
+
+class NFACursor:
+    """Resumable run of a :obj:`BitsetNFA` (holds only the active mask)."""
+    __slots__ = ('nfa', 'active')
+
+    def __init__(self, nfa):
+        self.nfa = nfa
+        self.active = nfa.start
+
+    def reset(self):
+        """Go back to the initial states."""
+        self.active = self.nfa.start
+
+    def feed(self, chunk):
+        """Consume a chunk of letters (str or bytes) and return the cursor."""
+        nfa, ids, active = self.nfa, self.nfa.letter_ids, self.active
+        for letter in as_letters(chunk):
+            if not active:
+                break
+            j = ids.get(letter)
+            active = 0 if j is None else nfa._step(active, j)
+
+        self.active = active
+        return self
+
+    def is_accepted(self):
+        """Return `True` if the consumed input is accepted."""
+        return self.active & self.nfa.accept != 0
+
+    @property
+    def active_states(self):
+        """Return names of the active states."""
+        return self.nfa.names(self.active)
+
+    async def feed_stream(self, reader, chunk_size=1 << 16):
+        """Consume a stream up to its end (see :func:`feed_stream`)."""
+        return await feed_stream(self, reader, chunk_size)
+
+    def __repr__(self):
+        """Describe object."""
+        return 'NFACursor: {}'.format(self.active_states)
+
+class DFACursor:
+    """Resumable run of a :obj:`CompiledDFA` (holds only the state id)."""
+    __slots__ = ('dfa', 'state')
+
+    def __init__(self, dfa):
+        self.dfa = dfa
+        self.state = dfa.start
+
+    def reset(self):
+        """Go back to the initial state."""
+        self.state = self.dfa.start
+
+    def feed(self, chunk):
+        """Consume a chunk of letters (str or bytes) and return the cursor."""
+        table, n, ids = self.dfa.table, self.dfa.n_letters, self.dfa.letter_ids
+        state = self.state
+        for letter in as_letters(chunk):
+            if state < 0:
+                break
+            j = ids.get(letter)
+            state = -1 if j is None else table[state * n + j]
+
+        self.state = state
+        return self
+
+    def is_accepted(self):
+        """Return `True` if the consumed input is accepted."""
+        return self.state >= 0 and self.dfa.accepting[self.state] != 0
+
+    async def feed_stream(self, reader, chunk_size=1 << 16):
+        """Consume a stream up to its end (see :func:`feed_stream`)."""
+        return await feed_stream(self, reader, chunk_size)
+
+    def __repr__(self):
+        """Describe object."""
+        return 'DFACursor: {}'.format(self.state)
+
+async def feed_stream(cursor, reader, chunk_size=1 << 16):
+    """Feed a cursor with the data of a stream up to its end.
+
+    Parameters
+    -----------
+    cursor : :obj:`DFACursor` or :obj:`NFACursor`
+        The cursor (each byte is a letter).
+
+    reader : :obj:`asyncio.StreamReader`
+        Any object with a coroutine `read(n)` returning bytes (empty at the end).
+
+    chunk_size : :obj:`int`
+        Maximum size of the chunks read from the stream.
+
+    Returns
+    --------
+    The cursor.
+
+    """
+    chunk = await reader.read(chunk_size)
+    while chunk:
+        cursor.feed(chunk)
+        chunk = await reader.read(chunk_size)
+
+    return cursor
+
+class LazyDFA:
+    """Deterministic automaton built on demand from a :obj:`BitsetNFA`.
+
+    Note
+    -----
+    A DFA state (a mask of NFA states) and its transitions are created only
+    when the input reaches them. At most `max_states` states are kept: when
+    the cache is full it is flushed. If the cache keeps being flushed while
+    the input makes little progress (less than `min_progress` letters per
+    cached state), the rest of that input is processed by direct NFA
+    simulation. The cache is mutated while matching, so an instance should
+    not be shared between threads.
+    """
+    def __init__(self, nfa, max_states=1024, min_progress=10):
+        """Constructor.
+
+        Parameters
+        -----------
+        nfa : :obj:`BitsetNFA`
+            The simulated NFA.
+
+        max_states : :obj:`int`
+            Maximum number of cached DFA states.
+
+        min_progress : :obj:`int`
+            Minimum number of letters per cached state between two flushes
+            below which the cache is considered to be thrashing.
+
+        """
+        if max_states < 1:
+            raise ValueError('max_states should be positive.')
+
+        self.nfa = nfa
+        self.max_states = max_states
+        self.min_progress = min_progress
+        self.states = dict()  # mask -> _LazyState
+        self.flushes = 0
+        self.fallbacks = 0
+
+    def _state(self, mask):
+        """Return the cached DFA state for a mask (flushing if necessary)."""
+        state = self.states.get(mask)
+        if state is None:
+            if len(self.states) >= self.max_states:
+                self.states.clear()
+                self.flushes += 1
+            state = self.states[mask] = _LazyState(mask, self.nfa)
+            if instrumentation.tracer is not None:
+                instrumentation.tracer.dfa_states(1)
+
+        return state
+
+    def final_states(self, string, stop=0):
+        """Return the mask of NFA states active after consuming string.
+
+        Parameters
+        -----------
+        string : iterable of letters
+            The input.
+
+        stop : :obj:`int`
+            Mask of NFA states: return the active states as soon as one of
+            them is active (e.g., the accepting states to search a prefix).
+
+        """
+        nfa, ids = self.nfa, self.nfa.letter_ids
+        budget = self.min_progress * self.max_states
+        last_flush = None  # number of letters consumed at the last flush
+        state = self._state(nfa.start)
+        letters = iter(string)
+        for consumed, letter in enumerate(letters):
+            if not state.mask or state.mask & stop:
+                return state.mask
+            j = ids.get(letter)
+            if j is None:
+                return 0
+
+            target = state.next[j]
+            if target is None:
+                mask = nfa._step(state.mask, j)
+                if mask not in self.states and len(self.states) >= self.max_states:
+                    if last_flush is not None and consumed - last_flush < budget:
+                        # the cache is thrashing: simulate the NFA from here on
+                        self.fallbacks += 1
+                        active = mask
+                        for letter in letters:
+                            if not active or active & stop:
+                                return active
+                            j = ids.get(letter)
+                            active = 0 if j is None else nfa._step(active, j)
+                        return active
+                    last_flush = consumed
+
+                target = state.next[j] = self._state(mask)
+            state = target
+
+        return state.mask
+
+    def run(self, string):
+        """Return `True` if the whole string is accepted."""
+        return self.final_states(string) & self.nfa.accept != 0
+
+    def fullmatch(self, string):
+        """Return `True` if the whole string is accepted (see :meth:`run`)."""
+        return self.run(string)
+
+    def matches(self, string):
+        """Return `True` if a prefix of the string is accepted."""
+        accept = self.nfa.accept
+        return self.final_states(string, accept) & accept != 0
+
+    def __repr__(self):
+        """Describe object."""
+        return 'LazyDFA: {}/{} states, {} flushes, {} fallbacks'.format(
+            len(self.states), self.max_states, self.flushes, self.fallbacks)
+
+class _LazyState:
+    """A state of a :obj:`LazyDFA` (successors are filled in on demand)."""
+    __slots__ = ('mask', 'next')
+
+    def __init__(self, mask, nfa):
+        self.mask = mask
+        self.next = [None] * len(nfa.alphabet)
+
+class FlatNFA:
+    """Immutable NFA stored in flat arrays (compressed sparse rows).
+
+    Note
+    -----
+    The transitions of state `i` upon letters are the pairs
+    ``(letters[k], targets[k])`` for `k` in ``range(offsets[i], offsets[i + 1])``
+    and its epsilon transitions are ``eps_targets[eps_offsets[i]:eps_offsets[i + 1]]``.
+    Sets of states are frozensets of ids, so the simulation and the subset
+    construction only touch the states that are actually active.
+    """
+    __slots__ = ('alphabet', 'letter_ids', 'n_states', 'start', 'final',
+                 'offsets', 'letters', 'targets', 'eps_offsets', 'eps_targets')
+
+    def __init__(self, alphabet, start, final, offsets, letters, targets,
+                 eps_offsets, eps_targets):
+        """Constructor.
+
+        Parameters
+        -----------
+        alphabet : :obj:`list(str)`
+            The alphabet (the position of a letter is its id).
+
+        start : :obj:`int`
+            Initial state.
+
+        final : iterable of :obj:`int`
+            Accepting states.
+
+        offsets, letters, targets : :obj:`array`
+            Transitions upon letters in CSR format.
+
+        eps_offsets, eps_targets : :obj:`array`
+            Epsilon transitions in CSR format.
+
+        """
+        self.alphabet = tuple(alphabet)
+        self.letter_ids = {letter: j for j, letter in enumerate(self.alphabet)}
+        self.n_states = len(offsets) - 1
+        self.start = start
+        self.final = frozenset(final)
+        self.offsets, self.letters, self.targets = offsets, letters, targets
+        self.eps_offsets, self.eps_targets = eps_offsets, eps_targets
+
+    def closure(self, states):
+        """Return the epsilon closure of a set of states."""
+        eps_offsets, eps_targets = self.eps_offsets, self.eps_targets
+        out, stack = set(states), list(states)
+        while stack:
+            s = stack.pop()
+            for t in eps_targets[eps_offsets[s]:eps_offsets[s + 1]]:
+                if t not in out:
+                    out.add(t)
+                    stack.append(t)
+
+        return frozenset(out)
+
+    def _moves(self, states):
+        """Return the targets upon each letter id from a set of states."""
+        offsets, letters, targets = self.offsets, self.letters, self.targets
+        moves = dict()
+        for s in states:
+            for k in range(offsets[s], offsets[s + 1]):
+                moves.setdefault(letters[k], []).append(targets[k])
+
+        return moves
+
+    def step(self, states, letter):
+        """Return the states reached from a set of states upon a letter."""
+        j = self.letter_ids.get(letter)
+        offsets, letters, targets = self.offsets, self.letters, self.targets
+        return self.closure([targets[k] for s in states
+                             for k in range(offsets[s], offsets[s + 1])
+                             if letters[k] == j])
+
+    def run(self, string):
+        """Return `True` if the whole string is accepted."""
+        states = self.closure([self.start])
+        for letter in string:
+            states = self.step(states, letter)
+            if not states:
+                return False
+
+        return not self.final.isdisjoint(states)
+
+    def fullmatch(self, string):
+        """Return `True` if the whole string is accepted (see :meth:`run`)."""
+        return self.run(string)
+
+    def matches(self, string):
+        """Return `True` if a prefix of the string is accepted."""
+        states = self.closure([self.start])
+        for letter in string:
+            if not self.final.isdisjoint(states):
+                return True
+            states = self.step(states, letter)
+            if not states:
+                return False
+
+        return not self.final.isdisjoint(states)
+
+    def bitset_nfa(self):
+        """Return a :obj:`BitsetNFA` simulating the automaton."""
+        eps_offsets, eps_targets = self.eps_offsets, self.eps_targets
+        closures = closure_masks([eps_targets[eps_offsets[i]:eps_offsets[i + 1]]
+                                  for i in range(self.n_states)])
+        successors = [[0] * self.n_states for _ in self.alphabet]
+        for s in range(self.n_states):
+            for k in range(self.offsets[s], self.offsets[s + 1]):
+                successors[self.letters[k]][s] |= closures[self.targets[k]]
+
+        accept = 0
+        for s in self.final:
+            accept |= 1 << s
+
+        return BitsetNFA(self.alphabet, closures[self.start], accept, successors)
+
+    def determinize(self):
+        """Return an equivalent :obj:`CompiledDFA` (subset construction).
+
+        Note
+        -----
+        Same numbering as :func:`subset_construction`, with sets of states
+        represented as frozensets of ids.
+        """
+        closure, moves, letters = self.closure, self._moves, range(len(self.alphabet))
+        start = closure([self.start])
+        sets, ids, table = [start], {start: 0}, array('i')
+        for states in sets:  # sets grows while iterating: it is the worklist
+            targets = moves(states)
+            for j in letters:
+                target = closure(targets.get(j, ()))
+                idx = ids.get(target)
+                if idx is None:
+                    idx = ids[target] = len(sets)
+                    sets.append(target)
+                table.append(idx)
+
+        if instrumentation.tracer is not None:
+            instrumentation.tracer.dfa_states(len(sets))
+
+        accepting = bytes(not self.final.isdisjoint(states) for states in sets)
+        return CompiledDFA(self.alphabet, table, 0, accepting)
+
+    def __repr__(self):
+        """Describe object."""
+        return 'FlatNFA: {} states, {} transitions, {} epsilon transitions'.format(
+            self.n_states, len(self.targets), len(self.eps_targets))
+
+def csr(n_states, sources, *columns):
+    """Sort edges by source state (counting sort) into compressed sparse rows.
+
+    Parameters
+    -----------
+    n_states : :obj:`int`
+        Number of states.
+
+    sources : :obj:`array`
+        Source state of each edge.
+
+    columns : :obj:`array`
+        Other attributes of the edges (e.g., letters and targets).
+
+    Returns
+    --------
+    The offsets (of size `n_states + 1`) followed by the sorted columns.
+
+    """
+    offsets = array('i', [0]) * (n_states + 1)
+    for s in sources:
+        offsets[s + 1] += 1
+    for i in range(n_states):
+        offsets[i + 1] += offsets[i]
+
+    position = offsets[:-1]
+    out = [array('i', [0]) * len(sources) for _ in columns]
+    for k, s in enumerate(sources):
+        p = position[s]
+        position[s] += 1
+        for column, sorted_column in zip(columns, out):
+            sorted_column[p] = column[k]
+
+    return (offsets, *out)
+
+def closure_masks(epsilon):
+    """Return the epsilon closure of every state as a bitmask.
+
+    Note
+    -----
+    Iterative Tarjan's algorithm: a strongly connected component is completed
+    after all components reachable from it, so its closure is the OR of its
+    own states and of the (already known) closures of its successors.
+
+    Parameters
+    -----------
+    epsilon : :obj:`list(list(int))`
+        `epsilon[i]` are the targets of the epsilon transitions of state `i`.
+
+    """
+    n = len(epsilon)
+    index, low, masks = [-1] * n, [0] * n, [0] * n
+    on_stack, stack, counter = [False] * n, [], 0
+    for root in range(n):
+        if index[root] >= 0:
+            continue
+
+        index[root] = low[root] = counter; counter += 1
+        stack.append(root); on_stack[root] = True
+        work = [(root, iter(epsilon[root]))]
+        while work:
+            v, successors = work[-1]
+            for w in successors:
+                if index[w] < 0:
+                    index[w] = low[w] = counter; counter += 1
+                    stack.append(w); on_stack[w] = True
+                    work.append((w, iter(epsilon[w])))
+                    break
+                elif on_stack[w]:
+                    low[v] = min(low[v], index[w])
+            else:
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    low[u] = min(low[u], low[v])
+
+                if low[v] == index[v]:
+                    component, mask = set(), 0
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        component.add(w)
+                        mask |= 1 << w
+                        if w == v:
+                            break
+
+                    for w in component:
+                        for x in epsilon[w]:
+                            if x not in component:
+                                mask |= masks[x]
+
+                    for w in component:
+                        masks[w] = mask
+
+    return masks
+
+def subset_construction(nfa):
+    """Determinize a :obj:`BitsetNFA`.
+
+    Note
+    -----
+    DFA states are keyed by the mask of the NFA states they represent and
+    are numbered in order of discovery. The worklist is FIFO, so the rows of
+    the transition table are emitted in the same order. The empty mask (if
+    reachable) is a rejecting state looping on every letter.
+
+    Returns
+    --------
+    masks : :obj:`list(int)`
+        NFA states corresponding to each DFA state (state 0 is initial).
+
+    table : :obj:`array`
+        Flat transition table (see :obj:`CompiledDFA`).
+
+    accepting : :obj:`bytes`
+        Accepting-state flags.
+
+    """
+    step, letters = nfa._step, range(len(nfa.alphabet))
+    masks = [nfa.start]
+    ids = {nfa.start: 0}
+    table = array('i')
+    for active in masks:  # masks grows while iterating: it is the worklist
+        for j in letters:
+            target = step(active, j)
+            idx = ids.get(target)
+            if idx is None:
+                idx = ids[target] = len(masks)
+                masks.append(target)
+            table.append(idx)
+
+    if instrumentation.tracer is not None:
+        instrumentation.tracer.dfa_states(len(masks))
+
+    accepting = bytes(mask & nfa.accept != 0 for mask in masks)
+    return masks, table, accepting
+
+def minimize(dfa):
+    """Minimize a :obj:`CompiledDFA` (Hopcroft's algorithm).
+
+    Note
+    -----
+    Unreachable states and dead states (from which no accepting state can be
+    reached) are pruned first, so the result may have undefined transitions.
+    States of the result are numbered in breadth-first order from the
+    initial state.
+
+    Returns
+    --------
+    :obj:`CompiledDFA`
+        The minimal DFA.
+
+    blocks : :obj:`list(list(int))`
+        The states of `dfa` merged into each state of the minimal DFA.
+
+    """
+    table, m, accepting, start = dfa.table, dfa.n_letters, dfa.accepting, dfa.start
+
+    order, reached = [start], {start}
+    for s in order:
+        for t in table[s * m:(s + 1) * m]:
+            if t >= 0 and t not in reached:
+                reached.add(t)
+                order.append(t)
+
+    predecessors = {s: [] for s in order}
+    for s in order:
+        for t in table[s * m:(s + 1) * m]:
+            if t >= 0:
+                predecessors[t].append(s)
+
+    stack = [s for s in order if accepting[s]]
+    live = set(stack)
+    while stack:
+        for s in predecessors[stack.pop()]:
+            if s not in live:
+                live.add(s)
+                stack.append(s)
+
+    keep = [s for s in order if s in live]
+    if not keep:
+        return CompiledDFA(dfa.alphabet, empty_table(1, m), 0, b'\0'), [[start]]
+
+    # renumber the kept states, state k is a sink replacing pruned states
+    k = len(keep)
+    new = {s: i for i, s in enumerate(keep)}
+    sub = array('i', [k]) * ((k + 1) * m)
+    for i, s in enumerate(keep):
+        for j, t in enumerate(table[s * m:(s + 1) * m]):
+            if t in new:
+                sub[i * m + j] = new[t]
+
+    block_of = _hopcroft(sub, m, [accepting[s] for s in keep] + [0])
+
+    # number the blocks in breadth-first order, skipping the sink block
+    sink = block_of[k]
+    representative = {}
+    for i in range(k + 1):
+        representative.setdefault(block_of[i], i)
+
+    ids, blocks = {block_of[0]: 0}, [block_of[0]]
+    for b in blocks:
+        i = representative[b]
+        for t in sub[i * m:(i + 1) * m]:
+            if block_of[t] != sink and block_of[t] not in ids:
+                ids[block_of[t]] = len(blocks)
+                blocks.append(block_of[t])
+
+    out = empty_table(len(blocks), m)
+    for b, idx in ids.items():
+        i = representative[b]
+        for j, t in enumerate(sub[i * m:(i + 1) * m]):
+            if block_of[t] != sink:
+                out[idx * m + j] = ids[block_of[t]]
+
+    members = [[] for _ in blocks]
+    for i, s in enumerate(keep):
+        members[ids[block_of[i]]].append(s)
+
+    accept = bytes(accepting[keep[representative[b]]] != 0 for b in blocks)
+    return CompiledDFA(dfa.alphabet, out, 0, accept), [sorted(b) for b in members]
+
+def _hopcroft(table, m, accepting):
+    """Return the block of every state in the coarsest stable partition.
+
+    Note
+    -----
+    The transition table should be complete. Runs in O(n m log n).
+    """
+    n = len(accepting)
+    inverse = [[[] for _ in range(n)] for _ in range(m)]
+    for s in range(n):
+        for j in range(m):
+            inverse[j][table[s * m + j]].append(s)
+
+    final = {s for s in range(n) if accepting[s]}
+    blocks = [b for b in (final, set(range(n)) - final) if b]
+    block_of = [0] * n
+    for b, members in enumerate(blocks):
+        for s in members:
+            block_of[s] = b
+
+    smallest = min(range(len(blocks)), key=lambda b: len(blocks[b]))
+    waiting = [(smallest, j) for j in range(m)]
+    in_waiting = set(waiting)
+    while waiting:
+        splitter = waiting.pop()
+        in_waiting.discard(splitter)
+        b, j = splitter
+
+        touched = {}  # block -> its states with a transition into block b
+        for t in blocks[b]:
+            for s in inverse[j][t]:
+                touched.setdefault(block_of[s], []).append(s)
+
+        for y, states in touched.items():
+            if len(states) == len(blocks[y]):
+                continue
+
+            split = set(states)
+            blocks[y] -= split
+            blocks.append(split)
+            z = len(blocks) - 1
+            for s in split:
+                block_of[s] = z
+
+            for c in range(m):
+                if (y, c) in in_waiting:
+                    added = (z, c)
+                else:
+                    added = (y, c) if len(blocks[y]) <= len(split) else (z, c)
+                waiting.append(added)
+                in_waiting.add(added)
+
+    return block_of
+
+def chunk_mapping(table, lookup, blocks, check_every=64):
+    """Run a DFA on a chunk of input from all its states at once.
+
+    Parameters
+    -----------
+    table : :obj:`numpy.ndarray`
+        Transition table (with a sink state and columns for padding and
+        unknown letters, see :meth:`CompiledDFA.match_many`).
+
+    lookup : :obj:`numpy.ndarray`
+        Character code -> letter id.
+
+    blocks : :obj:`numpy.ndarray` or iterable of :obj:`numpy.ndarray`
+        Character codes of the chunk (or of its consecutive blocks).
+
+    check_every : :obj:`int`
+        Number of letters between two merges of the runs that converged.
+
+    Returns
+    --------
+    :obj:`numpy.ndarray`
+        The state reached from each state.
+
+    Note
+    -----
+    Small DFAs (at most :obj:`COMPOSE_STATES` states) compose the mappings
+    of the letters pairwise with numpy (see :func:`_compose`), whether or
+    not the runs converge. Otherwise runs that reach the same state are
+    merged, so only the distinct live states are tracked (the runs in the
+    sink state are not continued): they are advanced by numpy steps while
+    more than :obj:`SCALAR_RUNS` runs remain, and one by one otherwise.
+    """
+    import numpy as np
+
+    if isinstance(blocks, np.ndarray):
+        blocks = [blocks]
+    sink = table.shape[0] - 1
+    compose = table.shape[0] <= COMPOSE_STATES
+    if compose:
+        table_t = np.ascontiguousarray(table.T)  # row j: mapping of letter j
+        mapping = np.arange(sink + 1, dtype=table.dtype)
+    else:
+        current = np.arange(sink, dtype=table.dtype)  # distinct live states
+        run_of = np.arange(sink + 1)  # start state -> index in current (-1: dead)
+        run_of[sink] = -1
+        rows = None
+
+    for codes in blocks:
+        ids = lookup[np.minimum(codes, len(lookup) - 1)]
+        if compose:
+            step = max(1, COMPOSE_CELLS // (sink + 1))
+            for begin in range(0, len(ids), step):
+                mapping = _compose(table_t, ids[begin:begin + step])[mapping]
+            if (mapping == sink).all():
+                break
+            continue
+
+        begin = 0
+        while begin < len(ids) and len(current):
+            if len(current) > SCALAR_RUNS:
+                for j in ids[begin:begin + check_every]:
+                    current = table[current, j]
+                begin += check_every
+            else:
+                if rows is None:
+                    rows = table.tolist()
+                block = ids[begin:].tolist()
+                states = []
+                for state in current.tolist():
+                    for j in block:
+                        state = rows[state][j]
+                        if state == sink:
+                            break
+                    states.append(state)
+                current = np.array(states, dtype=table.dtype)
+                begin = len(ids)
+
+            current, inverse = np.unique(current, return_inverse=True)
+            if current[-1] == sink:
+                current = current[:-1]
+                inverse[inverse == len(current)] = -1
+            run_of = np.where(run_of < 0, -1, inverse[run_of])
+
+        if not len(current):
+            break
+
+    if compose:
+        return mapping
+
+    return np.append(current, sink).astype(table.dtype)[run_of]
+
+def _compose(table_t, ids):
+    """Return the state-to-state mapping of a sequence of letters.
+
+    Note
+    -----
+    The sequence is padded to a power of two with the padding letter (the
+    identity) and adjacent mappings are composed pairwise, halving their
+    number at each level.
+    """
+    import numpy as np
+
+    pad = len(table_t) - 2
+    size = 1 << (len(ids) - 1).bit_length()
+    mappings = table_t[np.concatenate([ids, np.full(size - len(ids), pad, ids.dtype)])]
+    while len(mappings) > 1:
+        mappings = np.take_along_axis(mappings[1::2], mappings[0::2], axis=1)
+
+    return mappings[0]
+
+# set in each worker by _set_arrays
+_arrays = None
+
+def _set_arrays(table, lookup):
+    global _arrays
+    _arrays = (table, lookup)
+
+def _map_chunk(chunk):
+    return chunk_mapping(*_arrays, _read_chunk(*chunk))
+
+def _read_chunk(source, begin, end, block_size=BLOCK_SIZE):
+    """Generate the bytes [begin, end) of a file (path) or a bytes-like object.
+
+    Note
+    -----
+    The bytes are generated in blocks (numpy arrays) of at most `block_size`
+    bytes, copied from the memory-mapped file or viewed in the object.
+    """
+    import numpy as np
+
+    if not isinstance(source, (str, os.PathLike)):
+        for start in range(begin, end, block_size):
+            yield np.frombuffer(source, dtype=np.uint8,
+                                count=min(block_size, end - start), offset=start)
+        return
+
+    with open(source, 'rb') as h:
+        if not stat.S_ISREG(os.fstat(h.fileno()).st_mode):
+            raise ValueError('{} is not a regular file (chunks are read at '
+                             'given offsets).'.format(source))
+        if begin == end:
+            return
+        with mmap.mmap(h.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for start in range(begin, end, block_size):
+                yield np.frombuffer(mm[start:min(end, start + block_size)],
+                                    dtype=np.uint8)
+
+def load_dfa(path):
+    """Load a matcher saved with :meth:`CompiledDFA.save`.
+
+    Note
+    -----
+    The transition table is a read-only view of a memory-mapped file, so
+    processes loading the same file share its pages (on big-endian machines
+    the table is copied and byte-swapped instead).
+
+    Returns
+    --------
+    :obj:`CompiledDFA`
+
+    """
+    with open(path, 'rb') as h:
+        size = os.fstat(h.fileno()).st_size
+        if size < HEADER.size:
+            raise ValueError('{} is not a saved automaton.'.format(path))
+        mm = mmap.mmap(h.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, n_states, n_letters, start, alphabet_size = HEADER.unpack_from(mm)
+    if magic != MAGIC:
+        raise ValueError('{} is not a saved automaton.'.format(path))
+    if version != FORMAT_VERSION:
+        raise ValueError('{} has format version {} (expected {}).'.format(
+            path, version, FORMAT_VERSION))
+
+    offset = HEADER.size + alphabet_size
+    meta = json.loads(mm[HEADER.size:offset].decode('utf-8'))
+    bitmap = mm[offset:offset + (n_states + 7) // 8]
+    offset += len(bitmap)
+    offset += -offset % 4
+    if size != offset + 4 * n_states * n_letters:
+        raise ValueError('{} is truncated or corrupted.'.format(path))
+
+    accepting = bytes((bitmap[s >> 3] >> (s & 7)) & 1 for s in range(n_states))
+    if sys.byteorder == 'little':
+        table = memoryview(mm)[offset:].cast('i')
+    else:
+        table = array('i', mm[offset:])
+        table.byteswap()
+
+    return CompiledDFA(meta['alphabet'], table, start, accepting, meta['state_names'])
+
+def read_chunks(source, chunk_size=1 << 20):
+    """Generate the chunks of an input source.
+
+    Parameters
+    -----------
+    source : :obj:`str`, path, binary file object or iterable of chunks
+        A regular file given by its path is memory-mapped, other files
+        (e.g., pipes or devices) and file objects are read chunk by chunk, a
+        bytes-like object is a single chunk and any other iterable is passed
+        through.
+
+    chunk_size : :obj:`int`
+        Size (in bytes) of the chunks read from a file.
+
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as h:
+            st = os.fstat(h.fileno())
+            if not stat.S_ISREG(st.st_mode):
+                yield from read_chunks(h, chunk_size)
+                return
+            size = st.st_size
+            if size == 0:
+                return
+            with mmap.mmap(h.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mm, 'madvise'):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                for start in range(0, size, chunk_size):
+                    yield mm[start:start + chunk_size]
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        yield source
+    elif hasattr(source, 'read'):
+        chunk = source.read(chunk_size)
+        while chunk:
+            yield chunk
+            chunk = source.read(chunk_size)
+    else:
+        yield from source
+
+def as_letters(chunk):
+    """Return a chunk as a string of letters (each byte is a letter)."""
+    if isinstance(chunk, str):
+        return chunk
+
+    return bytes(chunk).decode('latin-1')
+
+def empty_table(n_states, n_letters):
+    """Return a flat transition table with all transitions undefined."""
+    return array('i', [-1]) * (n_states * n_letters)
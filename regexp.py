@@ -0,0 +1,186 @@
+"""Compile regular expressions to matchers.
+
+The syntax is the one of :func:`expression_tree.expr`: letters are single
+characters, '+' is the union, '*' the Kleene star and concatenation is
+implicit (or explicit with '.').
+"""
+from functools import lru_cache
+import hashlib
+import os
+
+import utils
+from automaton import Automaton, ThompsonArena, ThompsonConstruction
+from expression_tree import Add, Char, Empty, Epsilon, Multiply, Star
+from matchers import FORMAT_VERSION, load_dfa
+
+PRIORITY = {'*': 2, '.': 1, '+': 0}
+MODES = ('nfa', 'dfa', 'min-dfa')
+CACHE_SIZE = 512
+
+def to_postfix(pattern):
+    """Return the postfix form of a pattern (with explicit concatenation)."""
+    infix = utils.add_explicit_concatenation(pattern, ''.join(PRIORITY))
+    return utils.infix2postfix(infix, priority=dict(PRIORITY))
+
+def postfix2fragment(postfix, thompson):
+    """Return the Thompson fragment of a postfix pattern.
+
+    Returns
+    --------
+    :obj:`dict` with keys 'initial_state' and 'out_state'
+
+    """
+    stack = []
+    try:
+        for l in postfix:
+            if l == '*':
+                stack.append(thompson.expr_star(stack.pop()))
+            elif l == '+':
+                v2, v1 = stack.pop(), stack.pop()
+                stack.append(thompson.expr_union(v1, v2))
+            elif l == '.':
+                v2, v1 = stack.pop(), stack.pop()
+                stack.append(thompson.expr_concat(v1, v2))
+            elif l == '$':
+                raise ValueError("The letter '$' denotes epsilon transitions.")
+            else:
+                stack.append(thompson.create_expr(l))
+    except IndexError:
+        raise ValueError('Invalid pattern: {}'.format(postfix)) from None
+
+    if len(stack) != 1:
+        raise ValueError('Invalid pattern: {}'.format(postfix))
+
+    return stack[0]
+
+def expression2fragment(expression, thompson):
+    """Return the Thompson fragment of an :obj:`expression_tree.Expression`.
+
+    Note
+    -----
+    Unlike patterns, the letters of expression trees may be any character
+    (including operators), e.g., `Char('(') * Char('*')`, except '$' which
+    denotes epsilon transitions (use :obj:`expression_tree.EPSILON`).
+    """
+    stack = []
+    for node in expression.postorder():
+        if isinstance(node, Char):
+            if node.value == '$':
+                raise ValueError("The letter '$' denotes epsilon transitions.")
+            stack.append(thompson.create_expr(node.value))
+        elif isinstance(node, Epsilon):
+            stack.append(thompson.create_expr('$'))
+        elif isinstance(node, Empty):
+            stack.append(thompson.create_empty())
+        elif isinstance(node, Star):
+            stack.append(thompson.expr_star(stack.pop()))
+        elif isinstance(node, (Add, Multiply)):
+            right, left = stack.pop(), stack.pop()
+            if isinstance(node, Add):
+                stack.append(thompson.expr_union(left, right))
+            else:
+                stack.append(thompson.expr_concat(left, right))
+        else:
+            raise ValueError('Unknown expression node: {!r}'.format(node))
+
+    return stack[0]
+
+def letters(expression):
+    """Return the set of letters of an :obj:`expression_tree.Expression`."""
+    return {node.value for node in expression.get_nodes() if isinstance(node, Char)}
+
+def postfix2nfa(postfix, name='N'):
+    """Return the NFA of a postfix pattern (Thompson's construction)."""
+    thompson = ThompsonConstruction()
+    expr = postfix2fragment(postfix, thompson)
+
+    Sigma = sorted(set(postfix) - set(PRIORITY) - {'$'})
+    return Automaton(name, thompson.state_register.registered_states, Sigma,
+                     expr['initial_state'], expr['out_state'])
+
+def to_nfa(pattern, name='N'):
+    """Return the NFA of a pattern (Thompson's construction)."""
+    return postfix2nfa(to_postfix(pattern), name)
+
+def to_flat_nfa(pattern):
+    """Return the NFA of a pattern built in a :class:`automaton.ThompsonArena`."""
+    arena = ThompsonArena()
+    return arena.build(postfix2fragment(to_postfix(pattern), arena))
+
+def cache_path(cache_dir, pattern, mode):
+    """Return the file of a compiled pattern in a cache directory.
+
+    Note
+    -----
+    The name of the file is the SHA-256 hash of the pattern, the mode and
+    the version of the file format, so a changed pattern (or format) is
+    never served from a stale file.
+    """
+    key = '{}:{}:{}'.format(FORMAT_VERSION, mode, pattern).encode('utf-8')
+    return os.path.join(cache_dir, hashlib.sha256(key).hexdigest() + '.dfa')
+
+def compile(pattern, mode='dfa', cache_dir=None):
+    """Return a matcher for a pattern.
+
+    Parameters
+    -----------
+    pattern : :obj:`str`
+        The regular expression.
+
+    mode : :obj:`str`
+        'nfa' (bitset NFA simulation), 'dfa' (subset construction) or
+        'min-dfa' (minimized DFA).
+
+    cache_dir : :obj:`str`
+        Directory where DFAs are saved (see :func:`cache_path`). A pattern
+        that was compiled before (by any process) is loaded from its
+        memory-mapped file instead of being compiled again. Not used in
+        'nfa' mode.
+
+    Returns
+    --------
+    :obj:`matchers.BitsetNFA` or :obj:`matchers.CompiledDFA`
+        All matchers have the methods `fullmatch` (or its synonym `run`)
+        and `matches` (a prefix is accepted).
+
+    Note
+    -----
+    Matchers are immutable and memoized (LRU with at most :obj:`CACHE_SIZE`
+    entries keyed by pattern, mode and cache directory). Statistics are
+    available with `compile.cache_info()` and the cache is emptied with
+    `compile.cache_clear()`.
+    """
+    if mode not in MODES:
+        raise ValueError('Unknown mode: {} (expected one of {})'.format(mode, MODES))
+
+    return _compile(pattern, mode, cache_dir)
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _compile(pattern, mode, cache_dir):
+    if cache_dir is None or mode == 'nfa':
+        return _build(pattern, mode)
+
+    path = cache_path(cache_dir, pattern, mode)
+    try:
+        return load_dfa(path)
+    except (OSError, ValueError):
+        pass
+
+    matcher = _build(pattern, mode)
+    os.makedirs(cache_dir, exist_ok=True)
+    matcher.save(path)
+    return load_dfa(path)
+
+def _build(pattern, mode):
+    nfa = to_nfa(pattern)
+    if mode == 'nfa':
+        return nfa.bitset_nfa()
+
+    dfa = nfa.to_dfa()
+    if mode == 'min-dfa':
+        dfa = dfa.minimize()
+
+    return dfa.compile()
+
+compile.cache_info = _compile.cache_info
+compile.cache_clear = _compile.cache_clear
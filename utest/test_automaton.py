@@ -1,13 +1,85 @@
 """Utests for :class:`~automaton.Automaton` class."""
-from os.path import join
+from array import array
+import asyncio
+from itertools import product
+import io
+import os
+from os.path import abspath, dirname, join
+import shutil
+import subprocess
 import sys
+import tempfile
+import time
 import unittest
 import logging
 
 sys.path.append('..')
-from automaton import State, Automaton
+from automaton import (State, StateRegister, Automaton, ThompsonArena,
+                       ThompsonConstruction)
+import matchers
+from matchers import CompiledDFA, load_dfa
+import instrumentation
+import visualization
 import utils
 
+def sipser_1_35():
+    """Example 1.35, p. 52 (Sipser)."""
+    q1, q2, q3 = map(State, ['q1', 'q2', 'q3'])
+
+    q1.add_transition('b', q2)
+    q1.add_transition('$', q3)
+    q2.add_transition('a', [q2, q3])
+    q2.add_transition('b', q3)
+    q3.add_transition('a', q1)
+
+    return Automaton('M', [q1, q2, q3], ['a', 'b'], q1, q1)
+
+def sipser_1_30():
+    """Example 1.30, p. 51 (Sipser), extended with epsilon transitions."""
+    q1, q2, q3, q4 = map(State, ['q1', 'q2', 'q3', 'q4'])
+
+    q1.add_transition('1', [q1, q2])
+    q1.add_transition('0', q1)
+    q2.add_transition('0', q3)
+    q2.add_transition('1', q3)
+    q2.add_transition('$', q3)
+    q3.add_transition('0', q4)
+    q3.add_transition('1', q4)
+    q3.add_transition('$', q4)
+
+    return Automaton('M', [q1, q2, q3, q4], ['0', '1'], q1, q4)
+
+def nth_letter_from_end(n):
+    """NFA for (a+b)*a(a+b)^n (its DFA has 2^(n+1) states)."""
+    Q = [State('q{}'.format(i)) for i in range(n + 2)]
+    Q[0].add_transition('a', [Q[0], Q[1]])
+    Q[0].add_transition('b', Q[0])
+    for q, r in zip(Q[1:], Q[2:]):
+        q.add_transition('a', r)
+        q.add_transition('b', r)
+
+    return Automaton('M', Q, ['a', 'b'], Q[0], Q[-1])
+
+def accepts(M, word):
+    """Simulate M on word with :meth:`Automaton.transition`."""
+    M.reset()
+    for letter in word:
+        M.transition(letter)
+
+    return M.is_accepted()
+
+def timed(f, *args):
+    """Return the duration of f(*args)."""
+    start = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - start
+
+def words(Sigma, max_length):
+    """Generate all words over Sigma up to a given length."""
+    for n in range(max_length + 1):
+        for w in product(Sigma, repeat=n):
+            yield ''.join(w)
+
 class TestAutomaton(unittest.TestCase):
     """Utests for :class:`~automaton.Automaton` class."""
 
@@ -125,6 +197,408 @@ class TestAutomaton(unittest.TestCase):
 
         self.assertEqual(len(D.Q[5].ready), 0)
 
+    def test_epsilon_cycle(self):
+        """Epsilon cycles created by (a*)* are handled."""
+        thompson = ThompsonConstruction()
+        a = thompson.create_expr('a')
+        expr = thompson.expr_star(thompson.expr_star(a))
+        M = Automaton('M', thompson.state_register.registered_states, ['a'],
+                      expr['initial_state'], expr['out_state'])
+
+        self.assertEqual(len(expr['initial_state'].epsilon_closure()), 5)
+        for w in ['', 'a', 'aaa']:
+            self.assertTrue(accepts(M, w))
+            self.assertTrue(M.run(w))
+            self.assertTrue(M.to_dfa().compile().fullmatch(w))
+
+    def test_epsilon_closure_invalidation(self):
+        """Cached closures are updated when epsilon transitions are added."""
+        q1, q2, q3 = map(State, ['q1', 'q2', 'q3'])
+        q1.add_transition('$', q2)
+        self.assertSetEqual(set(q1.epsilon_closure()), {q1, q2})
+        q2.add_transition('a', q3)
+        self.assertSetEqual(set(q1.epsilon_closure()), {q1, q2})
+        q2.add_transition('$', q3)
+        self.assertSetEqual(set(q1.epsilon_closure()), {q1, q2, q3})
+
+        q4 = State('q4')
+        q4.clone_transitions(q1)
+        self.assertSetEqual(set(q4.epsilon_closure()), {q2, q3, q4})
+
+        # epsilon transitions between other states keep the closures valid
+        closure = q1.epsilon_closure()
+        p1, p2 = State('p1'), State('p2')
+        p1.add_transition('$', p2)
+        self.assertIs(q1.epsilon_closure(), closure)
+        self.assertTrue(q1._has_closure())
+        q3.add_transition('$', p1)
+        self.assertFalse(q1._has_closure())
+        self.assertSetEqual(set(q1.epsilon_closure()), {q1, q2, q3, p1, p2})
+
+    def test_state_register(self):
+        """States are unregistered from anywhere and keep their order."""
+        register = StateRegister()
+        states = [register.new_state() for _ in range(5)]
+        register.unregister_state(states[2])
+        register.unregister_state(states[0])
+        self.assertListEqual(register.registered_states, [states[1], states[3], states[4]])
+        self.assertEqual(register.new_state().name, 's5')
+        self.assertListEqual([s.name for s in register.registered_states],
+                             ['s1', 's3', 's4', 's5'])
+        with self.assertRaisesRegex(ValueError, 'Unknown state: s2'):
+            register.unregister_state(states[2])
+
+    def test_state_slots(self):
+        """States have slots (no instance dictionary)."""
+        q = State('q')
+        self.assertFalse(hasattr(q, '__dict__'))
+        with self.assertRaises(AttributeError):
+            q.label = 'initial'
+
+    def test_compile(self):
+        """Compiled DFA agrees with the NFA simulation."""
+        for M in [sipser_1_35(), sipser_1_30()]:
+            C = M.to_dfa().compile()
+            for w in words(M.Sigma, 6):
+                self.assertEqual(C.fullmatch(w), accepts(M, w), w)
+                self.assertEqual(C.matches(w),
+                                 any(accepts(M, w[:k]) for k in range(len(w) + 1)))
+
+        C = sipser_1_30().to_dfa().compile()
+        self.assertFalse(C.fullmatch('012'))
+        self.assertEqual(C.final_state('2'), -1)
+
+    def test_determinize(self):
+        """Subset construction on bitmasks yields the same DFA size."""
+        M = nth_letter_from_end(5)
+        D = M.to_dfa()
+        C = M.bitset_nfa().determinize()
+        self.assertEqual(len(D.Q), 2 ** 6)
+        self.assertEqual(C.n_states, 2 ** 6)
+        for w in words(M.Sigma, 8):
+            self.assertEqual(C.fullmatch(w), accepts(M, w), w)
+
+    def test_minimize(self):
+        """Equivalent states are merged, dead states are pruned."""
+        q0, q1, q2, q3, q4 = map(State, ['0', '1', '2', '3', '4'])
+        for q, a, b in [(q0, q1, q2), (q1, q3, q0), (q2, q3, q2), (q3, q1, q0)]:
+            q.add_transition('a', a)
+            q.add_transition('b', b)
+        D = Automaton('D', [q0, q1, q2, q3, q4], ['a', 'b'], q0, [q1, q3])
+
+        M = D.minimize()
+        self.assertListEqual([q.name for q in M.Q], ['0,2', '1,3'])
+        self.assertListEqual(M.F, [M.Q[1]])
+        for w in words(D.Sigma, 6):
+            self.assertEqual(accepts(M, w), accepts(D, w))
+
+        # the DFA of sipser_1_35 has a dead (empty) state, 2^4 states are minimal
+        for N, n in [(sipser_1_35(), 5), (nth_letter_from_end(3), 16)]:
+            D = N.to_dfa()
+            M = D.minimize()
+            self.assertEqual(len(M.Q), n)
+            C = M.compile()
+            for w in words(N.Sigma, 7):
+                self.assertEqual(C.fullmatch(w), accepts(N, w))
+
+    def test_compile_nondeterministic(self):
+        """Compiling an NFA is an error."""
+        with self.assertRaises(ValueError):
+            sipser_1_35().compile()
+
+    def test_match_many(self):
+        """Batch matching agrees with the compiled DFA."""
+        D = sipser_1_30().to_dfa()
+        C = D.compile()
+        batch = list(words(D.Sigma, 5)) + ['0120', '2', '']
+        accepted, states = D.match_many(batch, return_states=True)
+        self.assertListEqual(accepted.tolist(), [C.fullmatch(w) for w in batch])
+        self.assertListEqual(states.tolist(), [C.final_state(w) for w in batch])
+        self.assertEqual(len(C.match_many([])), 0)
+
+        # an outlier does not pad the other strings
+        batch = ['01' * 50000, '2' * 1000] + batch * 100 + ['201' * 3000]
+        accepted, states = C.match_many(batch, return_states=True)
+        self.assertListEqual(accepted.tolist(), [C.fullmatch(w) for w in batch])
+        self.assertListEqual(states.tolist(), [C.final_state(w) for w in batch])
+
+    def test_scan(self):
+        """Scanning files, file objects and chunks (state crosses chunks)."""
+        M = sipser_1_35()
+        C = M.to_dfa().compile()
+        data = 'babaabaa' * 50 + 'bbb' + 'a' * 10
+        expected = [k for k in range(len(data) + 1) if C.fullmatch(data[:k])]
+        self.assertEqual(expected[-1], 400)
+
+        with tempfile.NamedTemporaryFile() as h:
+            h.write(data.encode())
+            h.flush()
+            self.assertListEqual(list(M.scan(h.name, chunk_size=7)), expected)
+            self.assertListEqual(list(M.to_dfa().scan(h.name, chunk_size=3)),
+                                 expected)
+
+        source = io.BytesIO(data.encode())
+        self.assertListEqual(list(M.scan(source, chunk_size=5)), expected)
+        chunks = [data[k:k + 11] for k in range(0, len(data), 11)]
+        self.assertListEqual(list(M.to_dfa().scan(chunks)), expected)
+        self.assertListEqual(list(M.scan([b'ab', bytearray(b'b')])), [0, 1])
+
+        # pipes are read (not memory-mapped)
+        r, w = os.pipe()
+        with os.fdopen(w, 'wb') as h:
+            h.write(data.encode())
+        path = '/dev/fd/{}'.format(r)
+        try:
+            self.assertListEqual(list(M.scan(path, chunk_size=7)), expected)
+        finally:
+            os.close(r)
+        r, w = os.pipe()
+        os.close(w)
+        try:
+            with self.assertRaisesRegex(ValueError, 'not a regular file'):
+                M.parallel_run('/dev/fd/{}'.format(r))
+        finally:
+            os.close(r)
+
+        # the live states are computed once per matcher
+        self.assertIs(C.live_states(), C.live_states())
+        self.assertEqual(C.live_states(), bytes([1, 1, 1, 1, 1, 0]))  # 5 is dead
+
+    def test_bitset_nfa(self):
+        """Bitset simulation agrees with :meth:`Automaton.transition`."""
+        for M in [sipser_1_35(), sipser_1_30()]:
+            N = M.bitset_nfa()
+            for w in words(M.Sigma, 6):
+                self.assertEqual(N.run(w), accepts(M, w), w)
+                self.assertEqual(M.run(w), accepts(M, w), w)
+
+    def test_lazy_dfa(self):
+        """Lazy DFA agrees with the bitset simulation, also when thrashing."""
+        M = nth_letter_from_end(6)
+        N = M.bitset_nfa()
+        inputs = list(words(M.Sigma, 8)) + ['ab' * 200, 'abbab' * 100 + 'a' * 6]
+
+        L = M.lazy_dfa()
+        for w in inputs:
+            self.assertEqual(L.run(w), N.run(w), w)
+        self.assertEqual(L.flushes, 0)
+
+        L = M.lazy_dfa(max_states=4)
+        for w in inputs:
+            self.assertEqual(L.run(w), N.run(w), w)
+            self.assertEqual(L.matches(w), N.matches(w), w)
+        self.assertLessEqual(len(L.states), 4)
+        self.assertGreater(L.flushes, 0)
+        self.assertGreater(L.fallbacks, 0)
+
+        # searching a prefix also falls back to the NFA: (a+b)*a(a+b)^5c
+        Q = [State('q{}'.format(i)) for i in range(8)]
+        Q[0].add_transition('a', [Q[0], Q[1]])
+        Q[0].add_transition('b', Q[0])
+        for q, r in zip(Q[1:6], Q[2:7]):
+            q.add_transition('a', r)
+            q.add_transition('b', r)
+        Q[6].add_transition('c', Q[7])
+        M = Automaton('M', Q, ['a', 'b', 'c'], Q[0], Q[7])
+        N = M.bitset_nfa()
+        L = M.lazy_dfa(max_states=4)
+        for w in ['abbab' * 100, 'abbab' * 100 + 'aaaaaac', 'abbab' * 100 + 'c']:
+            self.assertEqual(L.matches(w), N.matches(w), w)
+        self.assertGreater(L.fallbacks, 0)
+
+    def test_cursor(self):
+        """A cursor can be fed input in pieces."""
+        M = sipser_1_35()
+        cursor = M.cursor()
+        self.assertListEqual(cursor.active_states, ['q1', 'q3'])
+        cursor.feed('ba')
+        self.assertListEqual(cursor.active_states, ['q2', 'q3'])
+        cursor.feed('b')
+        self.assertListEqual(cursor.active_states, ['q3'])
+        self.assertFalse(cursor.is_accepted())
+        self.assertTrue(cursor.feed('a').is_accepted())
+        cursor.feed('bbb')
+        self.assertListEqual(cursor.active_states, [])
+        cursor.reset()
+        self.assertTrue(cursor.is_accepted())
+
+    def test_freeze(self):
+        """Cursors of a frozen automaton are independent sessions."""
+        for M in [sipser_1_35(), nth_letter_from_end(2).to_dfa()]:
+            frozen = M.freeze()
+            cursors = [frozen.cursor() for _ in range(3)]
+            for w in words(M.Sigma, 4):
+                cursors[0].reset()
+                cursors[0].feed(w[:2]).feed(w[2:].encode())
+                self.assertEqual(cursors[0].is_accepted(), accepts(M, w), w)
+
+            async def session(cursor, data):
+                reader = asyncio.StreamReader()
+                reader.feed_data(data)
+                reader.feed_eof()
+                return (await cursor.feed_stream(reader, chunk_size=2)).is_accepted()
+
+            async def sessions():
+                return await asyncio.gather(session(cursors[1], b'babaa'),
+                                            session(cursors[2], b'bab'))
+
+            self.assertListEqual(asyncio.run(sessions()),
+                                 [accepts(M, 'babaa'), accepts(M, 'bab')])
+
+    def test_dot(self):
+        """Diagrams are streamed and can be restricted."""
+        M = sipser_1_35()
+        out = io.StringIO()
+        M.write_dot(out)
+        self.assertEqual(out.getvalue(), M.to_dot())
+        self.assertEqual(M.to_dot().count('->'), 6)
+        self.assertIn('"q2" -> "q3"[label="a, b"]', M.to_dot())
+
+        dot = M.to_dot(max_nodes=2)
+        self.assertNotIn('"q3"[', dot)
+        self.assertIn('1 more states', dot)
+
+        M.reset()
+        M.transition('b')
+        M.transition('a')
+        self.assertListEqual([s.name for s in M._dot_states('active', 0)], ['q2', 'q3'])
+        self.assertListEqual([s.name for s in M._dot_states('active')], ['q2', 'q3', 'q1'])
+        self.assertListEqual([s.name for s in M._dot_states(depth=1)], ['q1', 'q2', 'q3'])
+        self.assertListEqual([s.name for s in M._dot_states(depth=0)], ['q1'])
+
+        q = [State(str(i)) for i in range(2)]
+        for letter in 'abcdexz':
+            q[0].add_transition(letter, q[1])
+        N = Automaton('N', q, list('abcdexz'), q[0], q[1])
+        self.assertIn('[label="a-e, x, z"]', N.to_dot(ranges=True))
+
+    @unittest.skipUnless(shutil.which('dot'), 'graphviz is not installed')
+    def test_render_many(self):
+        """Diagrams are rendered concurrently."""
+        with tempfile.TemporaryDirectory() as directory:
+            jobs = [(sipser_1_35(), join(directory, 'M.svg')),
+                    ('digraph {}', join(directory, 'empty.svg'))]
+            filenames = visualization.render_many(jobs, max_nodes=2)
+            for filename in filenames:
+                with open(filename) as h:
+                    self.assertIn('<svg', h.read())
+
+    def test_parallel_run(self):
+        """Chunk mappings composed in order give the final state."""
+        M = nth_letter_from_end(3)
+        D = M.to_dfa().minimize().compile()
+        for w in words(['a', 'b', 'c'], 5):
+            for n_chunks in [1, 2, 4]:
+                self.assertEqual(D.parallel_final_state(w.encode(), n_chunks),
+                                 D.final_state(w), (w, n_chunks))
+
+        text = 'ab' * 1000 + 'abbb'
+        mappings = D.chunk_mappings(text.encode(), 3)
+        self.assertEqual(len(mappings), 3)
+        self.assertEqual(len(mappings[0]), D.n_states + 1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = join(directory, 'input.txt')
+            with open(path, 'w') as h:
+                h.write(text)
+            self.assertTrue(M.parallel_run(path, 5, workers=2))
+            self.assertTrue(M.parallel_run(text.encode(), 5, workers=2))
+            self.assertFalse(M.parallel_run(text[:-1].encode(), 3))
+
+        # runs merged when they converge (instead of composed mappings)
+        compose_states, matchers.COMPOSE_STATES = matchers.COMPOSE_STATES, 0
+        try:
+            for w in list(words(['a', 'b', 'c'], 4)) + [text]:
+                for n_chunks in [1, 3]:
+                    self.assertEqual(D.parallel_final_state(w.encode(), n_chunks),
+                                     D.final_state(w), (w, n_chunks))
+        finally:
+            matchers.COMPOSE_STATES = compose_states
+
+    def test_parallel_run_not_converging(self):
+        """Runs that never converge cost about as much as a sequential run."""
+        k = 6  # counter modulo k: the k runs never merge
+        D = CompiledDFA('ab', array('i', [(s + 1) % k for s in range(k) for _ in 'ab']),
+                        0, bytes([1] + [0] * (k - 1)))
+        text = 'ab' * 150000 + 'a'
+        expected = D.final_state(text)
+        self.assertEqual(D.parallel_final_state(text.encode(), 1), expected)
+        self.assertEqual(D.parallel_final_state(text.encode(), 3), expected)
+
+        sequential = min(timed(D.final_state, text) for _ in range(3))
+        parallel = min(timed(D.parallel_final_state, text.encode(), 1) for _ in range(3))
+        self.assertLess(parallel, 4 * sequential)
+
+    def test_instrumentation(self):
+        """Installed tracers are notified of the events."""
+        M = sipser_1_35()
+        events = []
+        with instrumentation.tracing(instrumentation.Counters(record_steps=True)) as counters:
+            instrumentation.install(instrumentation.CallbackTracer(
+                lambda event, *args: events.append(event)))
+            M.transition('b')
+            instrumentation.install(counters)
+            M.reset()
+            for letter in 'baa':
+                M.transition(letter)
+            D = M.to_dfa()
+        self.assertIsNone(instrumentation.tracer)
+
+        self.assertIn('transition', events)
+        self.assertEqual(counters.letters, 3)
+        self.assertListEqual([letter for letter, _ in counters.steps], list('baa'))
+        self.assertAlmostEqual(counters.seconds, sum(t for _, t in counters.steps))
+        self.assertEqual(counters.n_dfa_states, len(D.Q))
+        self.assertGreater(counters.activations, 0)
+        self.assertGreater(counters.deactivations, 0)
+
+        for s in M.Q:
+            s._closure = None  # forget the memoized closures
+        with instrumentation.tracing(instrumentation.Counters()) as counters:
+            M.epsilon_closure(M.Q)
+            M.epsilon_closure(M.Q)
+        self.assertEqual(counters.n_closures, len(M.Q))
+
+    def test_save_load(self):
+        """Saved automata are loaded with the same language."""
+        M = nth_letter_from_end(3).to_dfa().minimize()
+        with tempfile.TemporaryDirectory() as directory:
+            path = join(directory, 'M.dfa')
+            M.save(path)
+            C = load_dfa(path)
+            N = Automaton.load(path, 'N')
+            self.assertIsInstance(C.table, memoryview)
+            self.assertListEqual([s.name for s in N.Q], [s.name for s in M.Q])
+            for w in words(M.Sigma, 6):
+                self.assertEqual(C.fullmatch(w), accepts(M, w))
+                self.assertEqual(accepts(N, w), accepts(M, w))
+            del C
+
+            with open(path, 'r+b') as h:
+                h.write(b'XXXX')
+            with self.assertRaisesRegex(ValueError, 'not a saved automaton'):
+                load_dfa(path)
+
+    def test_thompson_arena(self):
+        """A dictionary of words is an n-ary union in the arena."""
+        words = [''.join(w) for w in product('abc', repeat=4)][::3]
+        arena = ThompsonArena()
+        fragments = []
+        for word in words:
+            fragment = arena.create_expr(word[0])
+            for letter in word[1:]:
+                fragment = arena.expr_concat(fragment, arena.create_expr(letter))
+            fragments.append(fragment)
+        nfa = arena.build(arena.expr_union_many(fragments))
+
+        self.assertEqual(nfa.n_states, 8 * len(words) + 2)
+        self.assertEqual(len(nfa.targets), 4 * len(words))
+        self.assertEqual(len(nfa.offsets), nfa.n_states + 1)
+        dfa = nfa.determinize()
+        for w in words:
+            self.assertTrue(nfa.run(w) and dfa.fullmatch(w))
+        for w in ['', 'a', 'aaab', 'aaaaa', 'abcd']:
+            self.assertFalse(nfa.run(w) or dfa.fullmatch(w))
+
 class TestUtils(unittest.TestCase):
     """Utests for utils."""
 
@@ -133,6 +607,21 @@ class TestUtils(unittest.TestCase):
         # disable logging at all levels
         logging.disable(logging.CRITICAL)
 
+    def test_letter_ranges(self):
+        """Consecutive letters are collapsed."""
+        self.assertListEqual(utils.letter_ranges(['b', 'a', 'c', 'x', 'z', '$']),
+                             ['a-c', 'x', 'z', '$'])
+        self.assertListEqual(utils.letter_ranges(['0', '1', 'ab']), ['0', '1', 'ab'])
+
+    def test_headless_import(self):
+        """The core modules do not import IPython (see benchmarks/bench_import.py)."""
+        script = ('import sys, automaton, expression_tree, regexp, utils; '
+                  'print("IPython" in sys.modules)')
+        out = subprocess.run([sys.executable, '-c', script], check=True,
+                             cwd=join(dirname(abspath(__file__)), '..'),
+                             capture_output=True, text=True)
+        self.assertEqual(out.stdout.strip(), 'False')
+
     def test_infix2postfix_1(self):
         """Test infix2postfix."""
         infix = '(a+b)*(a+c)+a+b*c'
@@ -165,3 +654,8 @@ class TestUtils(unittest.TestCase):
 
         self.assertEqual(utils.add_explicit_concatenation('a(a|b)*abb*ba|bb(a|b)(a|b*xg)'),
                          'a.(a|b)*.a.b.b*.b.a|b.b.(a|b).(a|b*.x.g)')
+
+        self.assertEqual(utils.add_explicit_concatenation('(a|b)a*(b)(c)'),
+                         '(a|b).a*.(b).(c)')
+        with self.assertRaises(ValueError):
+            utils.infix2postfix('a)')
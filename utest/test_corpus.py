@@ -0,0 +1,70 @@
+"""Utests for :mod:`corpus`."""
+import os
+import sys
+import tempfile
+import unittest
+import logging
+
+sys.path.append('..')
+import corpus
+import regexp
+
+class TestCorpus(unittest.TestCase):
+    """Utests for :func:`corpus.match_corpus`."""
+
+    def setUp(self):
+        """Define data and setup environment."""
+        # disable logging at all levels
+        logging.disable(logging.CRITICAL)
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.contents = ['abb', 'ab', 'aabb' * 50 + 'abb', '', 'babb', 'ac', 'b' * 1000]
+        self.paths = []
+        for i, content in enumerate(self.contents):
+            path = os.path.join(self.directory.name, '{}.txt'.format(i))
+            with open(path, 'w') as h:
+                h.write(content)
+            self.paths.append(path)
+
+        self.M = regexp.to_nfa('(a+b)*abb')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_match_corpus(self):
+        """Workers agree with the matcher of the current process."""
+        D = self.M.to_dfa().compile()
+        expected = {path: D.fullmatch(content)
+                    for path, content in zip(self.paths, self.contents)}
+        self.assertDictEqual(dict(corpus.match_corpus(self.M, self.paths, workers=1)),
+                             expected)
+        self.assertDictEqual(dict(corpus.match_corpus(D, self.paths, workers=3)),
+                             expected)
+
+    def test_pipe(self):
+        """Pipes are read up to their end (their size is unknown)."""
+        for content, accepted in [('aabb' * 50 + 'abb', True), ('abba', False)]:
+            r, w = os.pipe()
+            with os.fdopen(w, 'w') as h:
+                h.write(content)
+            path = '/dev/fd/{}'.format(r)
+            try:
+                self.assertListEqual(list(corpus.match_corpus(self.M, [path], workers=1)),
+                                     [(path, accepted)])
+            finally:
+                os.close(r)
+
+    def test_offsets(self):
+        """Offsets of the accepted prefixes."""
+        results = dict(corpus.match_corpus(self.M, self.paths[:3], workers=2,
+                                           offsets=True))
+        self.assertListEqual(results[self.paths[0]], [3])
+        self.assertListEqual(results[self.paths[1]], [])
+        self.assertListEqual(results[self.paths[2]], list(range(4, 201, 4)) + [203])
+
+    def test_balanced_batches(self):
+        """Batches have about the same total size."""
+        batches = corpus.balanced_batches(self.paths, 3)
+        self.assertListEqual(sorted(sum(batches, [])), sorted(self.paths))
+        self.assertListEqual(batches[0], [self.paths[6]])
+        self.assertListEqual(batches[1], [self.paths[2]])
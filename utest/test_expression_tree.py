@@ -0,0 +1,176 @@
+"""Utests for :mod:`expression_tree`."""
+from itertools import product
+import pickle
+import re
+import sys
+import unittest
+import logging
+
+sys.path.append('..')
+from expression_tree import (Add, Char, EMPTY, EPSILON, expr, glushkov, simplify,
+                             union)
+import utils
+
+def words(Sigma, max_length):
+    """Generate all words over Sigma up to a given length."""
+    for n in range(max_length + 1):
+        for w in product(Sigma, repeat=n):
+            yield ''.join(w)
+
+PATTERNS = ['(a+b)*abb', 'a(a+b)*b+b*', '((a*)*b)*', 'ab*a+ba*b', '(a+b*)(b+a*)']
+
+class TestGlushkov(unittest.TestCase):
+    """Utests for :func:`expression_tree.glushkov`."""
+
+    def setUp(self):
+        """Define data and setup environment."""
+        # disable logging at all levels
+        logging.disable(logging.CRITICAL)
+
+    def test_language(self):
+        """The position automaton agrees with python's re module."""
+        for pattern in PATTERNS:
+            G = glushkov(expr(pattern))
+            N = G.bitset_nfa()
+            python_pattern = re.compile(pattern.replace('+', '|'))
+            for w in words('ab', 7):
+                self.assertEqual(N.run(w), python_pattern.fullmatch(w) is not None,
+                                 (pattern, w))
+
+    def test_states(self):
+        """One state per letter occurrence and no epsilon transitions."""
+        a = Char('a')
+        G = glushkov((a * Char('b')).star() * a)
+        self.assertListEqual([q.name for q in G.Q], ['0', '1', '2', '3'])
+        self.assertTrue(all('$' not in q.transitions for q in G.Q))
+        self.assertListEqual(G.F, [G.Q[3]])
+        self.assertTrue(G.run('aba'))
+        self.assertTrue(G.to_dfa().compile().fullmatch('a'))
+        self.assertFalse(G.run('ab'))
+
+    def test_empty_and_epsilon(self):
+        """The empty language and the empty word have no positions."""
+        a = Char('a')
+        G = glushkov(a + EPSILON)
+        self.assertTrue(G.run('') and G.run('a'))
+        self.assertFalse(G.run('aa'))
+        G = glushkov(a * EMPTY + a.star() * EPSILON)
+        self.assertTrue(G.run('') and G.run('aa'))
+        self.assertFalse(glushkov(EMPTY).run(''))
+        with self.assertRaises(ValueError):
+            glushkov(Char('$'))
+
+class TestHashConsing(unittest.TestCase):
+    """Utests for the interning of expression nodes."""
+
+    def test_interning(self):
+        """Structurally equal nodes are the same object."""
+        e1, e2 = expr('(a+b)*abb'), expr('(a+b)*abb')
+        self.assertIs(e1, e2)
+        self.assertIs(Add(Char('a'), Char('b')), Char('a') + Char('b'))
+        self.assertIsNot(Char('a') + Char('b'), Char('b') + Char('a'))
+        self.assertEqual(len({e1, e2, expr('(a+b)*ab')}), 2)
+        self.assertEqual(len(expr('(ab)*ab').get_nodes()), 6)  # a and b are shared
+        self.assertIs(pickle.loads(pickle.dumps(e1)), e1)
+
+    def test_immutable(self):
+        """Nodes cannot be modified."""
+        with self.assertRaises(AttributeError):
+            Char('a').value = 'b'
+        with self.assertRaises(AttributeError):
+            expr('a*').right = Char('b')
+        with self.assertRaises(AttributeError):
+            Char('a').x = 1
+
+class TestDerivatives(unittest.TestCase):
+    """Utests for :meth:`expression_tree.Expression.derivative`."""
+
+    def setUp(self):
+        """Define data and setup environment."""
+        # disable logging at all levels
+        logging.disable(logging.CRITICAL)
+
+    def test_derivative(self):
+        """Derivatives are simplified."""
+        e = simplify(expr('(a+b)*abb'))
+        self.assertEqual(e.postfix(), 'ab+*abb...')
+        self.assertFalse(e.nullable())
+        self.assertEqual(e.derivative('b').postfix(), e.postfix())
+        self.assertIs(e.derivative('a'), union(simplify(expr('bb')), e))
+        self.assertEqual(e.derivative('c').postfix(), '\u2205')
+        self.assertTrue(expr('a*').derivative('a').nullable())
+        self.assertEqual(simplify(expr('(a*)*')).derivative('a').postfix(), 'a*')
+
+    def test_matcher(self):
+        """The derivative matcher agrees with python's re module."""
+        for pattern in PATTERNS:
+            matcher = expr(pattern).matcher()
+            python_pattern = re.compile(pattern.replace('+', '|'))
+            for w in words('abc', 6):
+                self.assertEqual(matcher.fullmatch(w),
+                                 python_pattern.fullmatch(w) is not None, (pattern, w))
+
+        # the derivatives of (a+b)*abb are the 4 states of its minimal DFA + the empty set
+        matcher = expr('(a+b)*abb').matcher()
+        for w in words('abc', 6):
+            matcher.fullmatch(w)
+        self.assertEqual(len(matcher.states), 5)
+
+    def test_long_expression(self):
+        """Long expressions do not hit the recursion limit."""
+        e = expr('ab' * 2000)
+        self.assertFalse(e.nullable())
+        self.assertTrue(expr('a*' * 2000).nullable())
+        matcher = e.matcher()
+        self.assertTrue(matcher.fullmatch('ab' * 2000))
+        self.assertFalse(matcher.fullmatch('ab' * 1999 + 'a'))
+        self.assertEqual(len(matcher.states), 4001)
+
+class TestTraversals(unittest.TestCase):
+    """Utests for the iterative traversals."""
+
+    def setUp(self):
+        """Define data and setup environment."""
+        # disable logging at all levels
+        logging.disable(logging.CRITICAL)
+
+    def test_orders(self):
+        """Pre-order and post-order generators."""
+        e = expr('(a+b)*c')
+        self.assertEqual(''.join(n.description() for n in e.preorder()), '.*+abc')
+        self.assertEqual(''.join(n.description() for n in e.postorder()), 'ab+*c.')
+        self.assertEqual(e.postfix(), 'ab+*c.')
+
+    def test_long_pattern(self):
+        """Deep trees do not hit the recursion limit."""
+        pattern = 'ab' * 2500 + '(a+b)*'
+        e = expr(pattern)
+        self.assertEqual(len(e.postfix()), 10004)
+        self.assertEqual(len(e.get_nodes()), 5004)
+        self.assertIn('->', e._to_dot())
+        G = glushkov(e)
+        self.assertEqual(len(G.Q), 5003)
+        self.assertTrue(G.run(pattern[:5000] + 'ba'))
+
+        root = utils.postfix2tree('a' + 'a+' * 5000)
+        self.assertEqual(root.get_postfix(), 'a' + 'a+' * 5000)
+        self.assertEqual(len(root.get_nodes()), 10001)
+        self.assertIn('->', root.to_dot())
+
+    def test_dot(self):
+        """Shared subtrees are drawn once and the size can be limited."""
+        e = expr('ab') + expr('ab')
+        self.assertEqual(e._to_dot().count('shape=circle'), 4)
+        self.assertEqual(e._to_dot().count('->'), 4)
+        dot = e._to_dot(max_nodes=2)
+        self.assertEqual(dot.count('shape=circle'), 2)
+        self.assertIn('shape=note', dot)
+
+    def test_shared_subtrees(self):
+        """Nodes and diagrams of a DAG are linear in the distinct nodes."""
+        e = Char('a')
+        for _ in range(40):
+            e = e + e * e
+        self.assertEqual(len(e.get_nodes()), 81)
+        self.assertEqual(e._to_dot().count('shape=circle'), 81)
+        self.assertEqual(e._to_dot().count('->'), 160)
@@ -0,0 +1,126 @@
+"""Utests for :class:`~lexer.Lexer` class."""
+from functools import reduce
+import glob
+import os
+import sys
+import unittest
+import logging
+
+sys.path.append('..')
+from expression_tree import Char, EMPTY, EPSILON, expr
+from lexer import Lexer
+import cool_lexer
+
+def one_of(characters):
+    """Union of single characters."""
+    return reduce(lambda x, y: x + y, map(Char, characters))
+
+class TestLexer(unittest.TestCase):
+    """Utests for :class:`~lexer.Lexer` class."""
+
+    def setUp(self):
+        """Define data and setup environment."""
+        # disable logging at all levels
+        logging.disable(logging.CRITICAL)
+
+        letter = one_of('abcdefghijklmnopqrstuvwxyz')
+        digit = one_of('0123456789')
+        self.lexer = Lexer([('IF', 'if'),
+                            ('ID', letter * (letter + digit).star()),
+                            ('NUM', digit * digit.star()),
+                            ('ARROW', Char('<') * Char('-')),
+                            ('LT', Char('<')),
+                            ('WS', one_of(' \n') * one_of(' \n').star())],
+                           skip=['WS'])
+
+    def test_tokenize(self):
+        """Longest match, rule priority and positions."""
+        tokens = list(self.lexer.tokenize('if iff <- 12\n  x1<y'))
+        self.assertListEqual([t.token for t in tokens],
+                             ['IF', 'ID', 'ARROW', 'NUM', 'ID', 'LT', 'ID'])
+        self.assertListEqual([t.lexeme for t in tokens],
+                             ['if', 'iff', '<-', '12', 'x1', '<', 'y'])
+        self.assertListEqual([(t.line, t.column) for t in tokens],
+                             [(1, 1), (1, 4), (1, 8), (1, 11), (2, 3), (2, 5), (2, 6)])
+
+    def test_error(self):
+        """Unexpected characters are reported with their position."""
+        tokens = self.lexer.tokenize('x\n 1 ?')
+        self.assertEqual(next(tokens).lexeme, 'x')
+        self.assertEqual(next(tokens).lexeme, '1')
+        with self.assertRaisesRegex(ValueError, 'line 2, column 4'):
+            next(tokens)
+
+    def test_handler(self):
+        """Handlers extend lexemes."""
+        def until_end_of_line(text, end):
+            newline = text.find('\n', end)
+            return len(text) if newline < 0 else newline
+
+        lexer = Lexer([('COMMENT', expr('ab')), ('ID', 'a+b')],
+                      handlers={'COMMENT': until_end_of_line})
+        tokens = list(lexer.tokenize('aab?!'))
+        self.assertListEqual([(t.token, t.lexeme) for t in tokens],
+                             [('ID', 'a'), ('COMMENT', 'ab?!')])
+
+    def test_empty_and_epsilon(self):
+        """Rules may contain the empty language and the empty word."""
+        lexer = Lexer([('A', Char('a') * EPSILON), ('B', Char('b') + EMPTY),
+                       ('NONE', EMPTY)])
+        self.assertListEqual([t.token for t in lexer.tokenize('aba')],
+                             ['A', 'B', 'A'])
+        with self.assertRaises(ValueError):
+            Lexer([('DOLLAR', Char('$'))])
+
+class TestCoolLexer(unittest.TestCase):
+    """Utests for :mod:`cool_lexer`."""
+
+    def setUp(self):
+        """Define data and setup environment."""
+        # disable logging at all levels
+        logging.disable(logging.CRITICAL)
+
+    def tokens(self, text):
+        return [(t.token, t.lexeme) for t in cool_lexer.tokenize(text)]
+
+    def test_keywords(self):
+        """Keywords are case insensitive (except true/false)."""
+        self.assertListEqual(self.tokens('CLASS Main inHerits IO tRUE True'),
+                             [('CLASS', 'CLASS'), ('TYPEID', 'Main'),
+                              ('INHERITS', 'inHerits'), ('TYPEID', 'IO'),
+                              ('BOOL_CONST', 'tRUE'), ('TYPEID', 'True')])
+        self.assertListEqual(self.tokens('x<-y<=3=>z_1'),
+                             [('OBJECTID', 'x'), ('ASSIGN', '<-'),
+                              ('OBJECTID', 'y'), ('LE', '<='), ('INT_CONST', '3'),
+                              ('DARROW', '=>'), ('OBJECTID', 'z_1')])
+
+    def test_comments_and_strings(self):
+        """Nested comments, line comments and escapes."""
+        text = '(* a (* b *) c *) "x\\"y\\\nz" -- (* not a comment\n(*)*)x'
+        tokens = list(cool_lexer.tokenize(text))
+        self.assertListEqual([(t.token, t.lexeme) for t in tokens],
+                             [('STR_CONST', '"x\\"y\\\nz"'), ('OBJECTID', 'x')])
+        self.assertEqual((tokens[1].line, tokens[1].column), (3, 6))
+
+        with self.assertRaisesRegex(ValueError, 'EOF in comment'):
+            self.tokens('(* (* *)')
+        with self.assertRaisesRegex(ValueError, 'Unmatched'):
+            self.tokens('x *)')
+
+    def test_any_character(self):
+        """'$' in strings and any character in line comments."""
+        self.assertListEqual(self.tokens('-- costs $5\nx'), [('OBJECTID', 'x')])
+        self.assertListEqual(self.tokens('-- café\nx'), [('OBJECTID', 'x')])
+        self.assertListEqual(self.tokens('"$" --'), [('STR_CONST', '"$"')])
+        with self.assertRaisesRegex(ValueError, 'Unexpected'):
+            self.tokens('"\0"')
+        with self.assertRaisesRegex(ValueError, 'Unexpected'):
+            self.tokens('x $')
+
+    def test_sources(self):
+        """The bundled sources are lexed."""
+        root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+        for filename in (glob.glob(os.path.join(root, 'cool_examples', '*.cl')) +
+                         [os.path.join(root, 'libs', 'atoi.cl')]):
+            tokens = list(cool_lexer.tokenize_file(filename))
+            self.assertEqual(tokens[0].token, 'CLASS')
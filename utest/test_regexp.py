@@ -0,0 +1,118 @@
+"""Utests for :mod:`regexp`."""
+import os
+import re
+import sys
+import tempfile
+import unittest
+import logging
+from itertools import product
+
+sys.path.append('..')
+import regexp
+
+class TestRegexp(unittest.TestCase):
+    """Utests for :func:`regexp.compile`."""
+
+    def setUp(self):
+        """Define data and setup environment."""
+        # disable logging at all levels
+        logging.disable(logging.CRITICAL)
+        regexp.compile.cache_clear()
+
+    def test_modes(self):
+        """All modes agree with python's re module."""
+        for pattern in ['(a+b)*abb', 'a(a+b)*b+b*', '((a*)*b)*', 'ab*a+ba*b']:
+            python_pattern = re.compile(pattern.replace('+', '|'))
+            matchers = [regexp.compile(pattern, mode) for mode in regexp.MODES]
+            for n in range(7):
+                for w in map(''.join, product('ab', repeat=n)):
+                    expected = python_pattern.fullmatch(w) is not None
+                    prefix = python_pattern.match(w) is not None
+                    for matcher in matchers:
+                        self.assertEqual(matcher.fullmatch(w), expected, (pattern, w))
+                        self.assertEqual(matcher.run(w), expected, (pattern, w))
+                        self.assertEqual(matcher.matches(w), prefix, (pattern, w))
+
+    def test_flat_nfa(self):
+        """The arena NFA agrees with python's re module."""
+        for pattern in ['(a+b)*abb', 'a(a+b)*b+b*', '((a*)*b)*', 'ab*a+ba*b']:
+            python_pattern = re.compile(pattern.replace('+', '|'))
+            nfa = regexp.to_flat_nfa(pattern)
+            matchers = [nfa, nfa.bitset_nfa(), nfa.determinize(),
+                        nfa.bitset_nfa().determinize()]
+            for n in range(7):
+                for w in map(''.join, product('ab', repeat=n)):
+                    expected = python_pattern.fullmatch(w) is not None
+                    prefix = python_pattern.match(w) is not None
+                    for matcher in matchers:
+                        self.assertEqual(matcher.fullmatch(w), expected, (pattern, w))
+                        self.assertEqual(matcher.matches(w), prefix, (pattern, w))
+
+    def test_minimal(self):
+        """Example 3.36 of the Dragon book (2nd ed.)."""
+        self.assertEqual(regexp.compile('(a+b)*abb').n_states, 5)
+        self.assertEqual(regexp.compile('(a+b)*abb', 'min-dfa').n_states, 4)
+
+    def test_cache(self):
+        """Compiled matchers are memoized."""
+        m1 = regexp.compile('(a+b)*abb')
+        m2 = regexp.compile('(a+b)*abb')
+        m3 = regexp.compile('(a+b)*abb', 'nfa')
+        self.assertIs(m1, m2)
+        self.assertIsNot(m1, m3)
+        info = regexp.compile.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 2))
+
+    def test_cache_dir(self):
+        """Compiled DFAs are saved in and loaded from a cache directory."""
+        with tempfile.TemporaryDirectory() as cache_dir:
+            m1 = regexp.compile('(a+b)*abb', cache_dir=cache_dir)
+            path = regexp.cache_path(cache_dir, '(a+b)*abb', 'dfa')
+            self.assertListEqual(os.listdir(cache_dir), [os.path.basename(path)])
+            self.assertNotEqual(path, regexp.cache_path(cache_dir, '(a+b)*aba', 'dfa'))
+
+            regexp.compile.cache_clear()
+            modified = os.stat(path).st_mtime_ns
+            m2 = regexp.compile('(a+b)*abb', cache_dir=cache_dir)
+            self.assertEqual(os.stat(path).st_mtime_ns, modified)
+            self.assertEqual(m2.n_states, 5)
+            self.assertTrue(m2.fullmatch('babb'))
+            self.assertFalse(m2.fullmatch('abba'))
+            self.assertEqual(bytes(m1.table), bytes(m2.table))
+            del m1, m2
+
+    def test_invalid(self):
+        """Invalid patterns and modes are reported."""
+        with self.assertRaises(ValueError):
+            regexp.compile('a+')
+        with self.assertRaises(ValueError):
+            regexp.compile('a', 'lazy')
+        for mode in regexp.MODES:
+            with self.assertRaisesRegex(ValueError, 'epsilon', msg=mode):
+                regexp.compile('a+$', mode)
+        with self.assertRaisesRegex(ValueError, 'epsilon'):
+            regexp.to_flat_nfa('$')
+        for pattern in ['a)', '(a', 'a)(b', '()']:
+            with self.assertRaises(ValueError, msg=pattern):
+                regexp.compile(pattern)
+
+    def test_letters(self):
+        """Letters are any characters except operators and parentheses."""
+        for pattern, accepted, rejected in [('a1', 'a1', 'a'), ('01*', '011', '10'),
+                                            ('a_b', 'a_b', 'ab'), ('(-+/)?', '/?', '?'),
+                                            ('#(x+0)!', '#0!', '#!')]:
+            for mode in regexp.MODES:
+                matcher = regexp.compile(pattern, mode)
+                self.assertTrue(matcher.fullmatch(accepted), (pattern, mode))
+                self.assertFalse(matcher.fullmatch(rejected), (pattern, mode))
+
+    def test_implicit_concatenation(self):
+        """Concatenation after ')' and before '(' is implicit."""
+        for pattern, accepted, rejected in [('(a+b)a', 'ba', 'b'),
+                                            ('a*(b)', 'aab', 'aa'),
+                                            ('(a)(b)*', 'abb', 'b'),
+                                            ('a*(b)*a', 'abba', 'ab')]:
+            for mode in regexp.MODES:
+                matcher = regexp.compile(pattern, mode)
+                self.assertTrue(matcher.fullmatch(accepted), (pattern, mode))
+                self.assertFalse(matcher.fullmatch(rejected), (pattern, mode))
@@ -1,13 +1,11 @@
-import os
-import subprocess
+import io
 import re
 
-from automaton import ThompsonConstruction
-
-from IPython.display import Image, display
-
 def infix2postfix(infix, priority=None):
-    """Infix to postfix conversion."""
+    """Infix to postfix conversion.
+
+    Raises `ValueError` if the parentheses are not balanced.
+    """
     if priority is None:
         priority = {'*': 3, '.': 2, '+': 1}
     postfix, op_stack = [], []
@@ -18,10 +16,11 @@ def infix2postfix(infix, priority=None):
         elif l == '(':
             op_stack.append(l)
         elif l == ')':
-            top = op_stack.pop()
-            while op_stack and top != '(':
-                postfix.append(top)
-                top = op_stack.pop()
+            while op_stack and op_stack[-1] != '(':
+                postfix.append(op_stack.pop())
+            if not op_stack:
+                raise ValueError('Unbalanced parentheses: {}'.format(infix))
+            op_stack.pop()
         elif l in operators:
             # operators with higher priority appear towards the top of the stack
             while op_stack and priority[op_stack[-1]] >= priority[l]:
@@ -29,7 +28,10 @@ def infix2postfix(infix, priority=None):
             op_stack.append(l)
         else: postfix.append(l)
 
-    while op_stack: postfix.append(op_stack.pop())
+    while op_stack:
+        if op_stack[-1] == '(':
+            raise ValueError('Unbalanced parentheses: {}'.format(infix))
+        postfix.append(op_stack.pop())
 
     return ''.join(postfix)
 
@@ -49,13 +51,26 @@ def postfix_eval(postfix, op_apply):
 
     return var_stack[0]
 
-# use of lookahead assertion (?=...) prevents consuming the second pattern
-pattern1 = re.compile(r'([a-zA-Z])(?=[a-zA-Z])')
-pattern2 = re.compile(r'([a-zA-Z])(\()')
-pattern3 = re.compile(r'(\))([a-zA-Z])')
-pattern3 = re.compile(r'(\))(\()')
-pattern4 = re.compile(r'(\*)([a-zA-Z])')
-def add_explicit_concatenation(infix):
+def letter_ranges(letters):
+    """Collapse runs of (at least 3) consecutive characters into ranges.
+
+    Example
+    --------
+    letter_ranges(['b', 'a', 'c', 'x', 'z', '$']) -> ['a-c', 'x', 'z', '$']
+    """
+    characters = sorted({l for l in letters if len(l) == 1 and l != '$'})
+    out, start = [], 0
+    for end in range(1, len(characters) + 1):
+        if end == len(characters) or ord(characters[end]) != ord(characters[end - 1]) + 1:
+            if end - start >= 3:
+                out.append('{}-{}'.format(characters[start], characters[end - 1]))
+            else:
+                out.extend(characters[start:end])
+            start = end
+
+    return out + [l for l in letters if len(l) != 1 or l == '$']
+
+def add_explicit_concatenation(infix, operators='+.*|'):
     """Add explicit concatenation operator to an infix format.
 
     The concatenation of two letters 'a' and 'b'
@@ -64,16 +79,27 @@ def add_explicit_concatenation(infix):
     we have to use the latter. This function adds an explicit
     '.' whenever necessary.
 
+    Parameters
+    -----------
+    infix : :obj:`str`
+        Expression in infix format.
+
+    operators : :obj:`str`
+        The operators: a letter is any other character except parentheses
+        and white space.
+
     Example
     --------
     add_explicit_concatenation('a(a|b)*a.bb') -> 'a.(a|b)*.a.b.b'
+    add_explicit_concatenation('(a|b)a*(b)') -> '(a|b).a*.(b)'
+    add_explicit_concatenation('a1_') -> 'a.1._'
     """
-    infix = re.sub(pattern1, r'\1.', infix)
-    infix = re.sub(pattern2, r'\1.\2', infix)
-    infix = re.sub(pattern3, r'\1.\2', infix)
-    infix = re.sub(pattern4, r'\1.\2', infix)
+    letter = '[^{}()\\s]'.format(re.escape(operators))
+    # a letter, ')' or '*' followed by a letter or '(': the lookahead
+    # assertion (?=...) prevents consuming the second one
+    pattern = '({}|[)*])(?={}|\\()'.format(letter, letter)
 
-    return infix
+    return re.sub(pattern, r'\1.', infix)
 
 # class ExpressionTree():
 # def __init__(self):
@@ -85,71 +111,56 @@ class Node():
     def __init__(self, value=None, left=None, right=None):
         self.value, self.left, self.right = value, left, right
 
-    def _get_postfix(self, p):
-        if self.left is not None:
-            self.left._get_postfix(p)
-        if self.right is not None:
-            self.right._get_postfix(p)
-        p.append(self.value)
+    def children(self):
+        """Return the (non-empty) children of the node."""
+        return tuple(child for child in (self.left, self.right) if child is not None)
+
+    def preorder(self):
+        """Generate the nodes of the (sub-)tree in pre-order (explicit stack)."""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children()))
+
+    def postorder(self):
+        """Generate the nodes of the (sub-)tree in post-order (explicit stack)."""
+        stack = [(self, False)]
+        while stack:
+            node, expanded = stack.pop()
+            children = node.children()
+            if expanded or not children:
+                yield node
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(children))
 
     def get_postfix(self):
         """Return postfix form of the expression (postorder walk)."""
-        p = []; self._get_postfix(p)
-        return ''.join(p)
+        return ''.join(node.value for node in self.postorder())
 
     def get_nodes(self):
-        """Return a list of nodes in the (sub-)tree."""
-        nodes = set([self])
-        if self.left is not None:
-            nodes = nodes.union(self.left.get_nodes())
-
-        if self.right is not None:
-            nodes = nodes.union(self.right.get_nodes())
-
-        return nodes
-
-    def show_dot(self, filename=None, rankdir='TB'):
-        """Display the dot diagram."""
-        if filename is None:
-            filename = '_pet.png'
-        tmp_name, extension = os.path.splitext(os.path.basename(filename))
-        extension = extension[1:]
-
-        with open(tmp_name + '.dot', 'w') as h:
-            h.write(self.to_dot(rankdir))
-
-        subprocess.call(['dot',
-                         '-T{}'.format(extension),
-                         tmp_name + '.dot',
-                         '-o',
-                         filename])
-        subprocess.call(['rm', tmp_name + '.dot'])
-        display(Image(filename))
-
-    def to_dot(self, rankdir='TB', dpi=100):
-        """Visualize with graphviz dot."""
-        dot_str = 'digraph FA {\n'
-        dot_str += 'graph [dpi={}]\n'.format(dpi)
-        dot_str += 'edge [arrowhead="empty"]\n'
-        dot_str += 'rankdir={}\n'.format(rankdir)
-
-        node_names = dict()
-        nodes = self.get_nodes()
-        for node in nodes:
-            node_names[node] = '{}'.format(len(node_names))
-            dot_str += '"{}"[label="{}", shape=circle]\n'.format(node_names[node],
-                                                                 node.value)
-
-        for node in nodes:
-            if node.left is not None:
-                dot_str += '"{}" -> "{}"\n'.format(node_names[node], node_names[node.left])
-
-            if node.right is not None:
-                dot_str += '"{}" -> "{}"\n'.format(node_names[node], node_names[node.right])
-
-        dot_str += '}\n'
-
-        return dot_str
+        """Return a set of nodes in the (sub-)tree."""
+        return set(distinct_preorder(self))
+
+    def show_dot(self, filename=None, rankdir='TB', **options):
+        """Display the dot diagram (see :func:`visualization.show`)."""
+        import visualization
+
+        visualization.show(self, '_pet.png' if filename is None else filename,
+                           rankdir=rankdir, **options)
+
+    def to_dot(self, rankdir='TB', dpi=100, **options):
+        """Visualize with graphviz dot (see :meth:`write_dot`)."""
+        out = io.StringIO()
+        self.write_dot(out, rankdir, dpi, **options)
+
+        return out.getvalue()
+
+    def write_dot(self, stream, rankdir='TB', dpi=100, max_nodes=None):
+        """Write the dot diagram to a text stream (see :func:`write_tree_dot`)."""
+        write_tree_dot(stream, self, lambda node: node.value, rankdir, dpi,
+                       max_nodes, name='FA')
 
     def __repr__(self):
         return '[{}] \n l: {}, r: {}'.format(self.value,
@@ -186,3 +197,64 @@ def postfix2tree(postfix, token_type=None):
         raise ValueError('Multi-letter variables not allowed.')
 
     return stack[0]
+
+def distinct_preorder(root):
+    """Generate the distinct nodes of a tree (or a DAG) in pre-order.
+
+    Note
+    -----
+    The children of a node are visited only when the node is first seen, so
+    the cost is linear in the number of distinct nodes (instead of the number
+    of occurrences for shared subtrees).
+    """
+    seen = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node in seen:
+            continue
+        seen.add(node)
+        yield node
+        stack.extend(reversed(node.children()))
+
+def write_tree_dot(stream, root, label, rankdir='TB', dpi=100, max_nodes=None,
+                   name='Tree'):
+    """Write the dot diagram of a tree to a text stream (line by line).
+
+    Parameters
+    -----------
+    stream : text file object
+        Where to write the diagram.
+
+    root : :obj:`Node` or :obj:`expression_tree.Expression`
+        Root of the tree (nodes have a method `children`). Shared subtrees
+        are drawn once.
+
+    label : :obj:`callable`
+        Return the label of a node.
+
+    max_nodes : :obj:`int`
+        Draw at most `max_nodes` nodes (in pre-order).
+
+    """
+    write = stream.write
+    write('digraph {} {{\n'.format(name))
+    write('graph [dpi={}]\n'.format(dpi))
+    write('edge [arrowhead="empty"]\n')
+    write('rankdir={}\n'.format(rankdir))
+
+    node_names = dict()
+    for node in distinct_preorder(root):
+        if max_nodes is not None and len(node_names) >= max_nodes:
+            write('"..."[label="more nodes", shape=note]\n')
+            break
+        node_names[node] = '{}'.format(len(node_names))
+        write('"{}"[label="{}", shape=circle]\n'.format(node_names[node],
+                                                        label(node)))
+
+    for node, node_name in node_names.items():
+        for child in node.children():
+            if child in node_names:
+                write('"{}" -> "{}"\n'.format(node_name, node_names[child]))
+
+    write('}\n')
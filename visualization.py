@@ -0,0 +1,91 @@
+"""Rendering of dot diagrams (graphviz) and display in IPython.
+
+Note
+-----
+The automata and expression modules import this module only when a diagram
+is displayed, so the matching engine does not depend on IPython. Diagrams
+are written directly to the input of `dot` (no temporary files).
+"""
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import subprocess
+
+def render(graph, filename, output_format=None, **options):
+    """Render a diagram to a file with `dot`.
+
+    Parameters
+    -----------
+    graph : :obj:`str` or object with a method `write_dot(stream, **options)`
+        The diagram in dot format, or an automaton or expression tree that
+        writes it (e.g., :meth:`automaton.Automaton.write_dot`).
+
+    filename : :obj:`str`
+        The rendered image.
+
+    output_format : :obj:`str`
+        Output format of `dot` (default: the extension of filename).
+
+    options
+        Passed to `write_dot` (e.g., `max_nodes` or `rankdir`).
+
+    Returns
+    --------
+    :obj:`str`
+        The filename.
+
+    """
+    if output_format is None:
+        output_format = os.path.splitext(filename)[1][1:]
+
+    command = ['dot', '-T{}'.format(output_format), '-o', filename]
+    with subprocess.Popen(command, stdin=subprocess.PIPE) as process:
+        with io.TextIOWrapper(process.stdin, encoding='utf-8') as stream:
+            if isinstance(graph, str):
+                stream.write(graph)
+            else:
+                graph.write_dot(stream, **options)
+
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+    return filename
+
+def render_many(jobs, workers=None, output_format=None, **options):
+    """Render several diagrams concurrently (one `dot` process per diagram).
+
+    Parameters
+    -----------
+    jobs : iterable of :obj:`tuple`
+        Pairs (graph, filename), see :func:`render`.
+
+    workers : :obj:`int`
+        Maximum number of `dot` processes running at the same time.
+
+    Returns
+    --------
+    :obj:`list(str)`
+        The filenames (in the order of the jobs).
+
+    """
+    with ThreadPoolExecutor(workers) as pool:
+        futures = [pool.submit(render, graph, filename, output_format, **options)
+                   for graph, filename in jobs]
+
+        return [future.result() for future in futures]
+
+def show(graph, filename, **options):
+    """Render a diagram (see :func:`render`) and display it in IPython.
+
+    Note
+    -----
+    The image is only written to the file when IPython is not installed.
+    """
+    render(graph, filename, **options)
+
+    try:
+        from IPython.display import Image, display
+    except ImportError:
+        return
+
+    display(Image(filename))